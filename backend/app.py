@@ -15,26 +15,62 @@ from flask_jwt_extended import (
 from flask_migrate import Migrate
 from datetime import timedelta
 import os
-import glob
-import face_recognition
-from functools import wraps
+from functools import partial, wraps
+import numpy as np
 
-from extensions import db, bcrypt
+from extensions import db, bcrypt, gallery_cache, face_pool, photo_catalog, job_queue, attendance_cache
+from utils.face_pool import WorkerPoolBusy
+from utils.jobs import JobQueueFull
+from utils.db_config import database_uri, engine_options, configure_sqlite
+from datetime import datetime, date
+import tempfile
+import traceback
 
 app = Flask(__name__)
 
 # ==================== CONFIG ====================
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()  # DATABASE_URL, default sqlite:///app.db
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'dev-secret-key-change-in-production'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+app.config['IMAGES_DIR'] = 'images'
+app.config['GALLERY_CACHE_SIZE'] = int(os.environ.get('GALLERY_CACHE_SIZE', 32))
+app.config['GALLERY_CACHE_TTL'] = int(os.environ.get('GALLERY_CACHE_TTL', 300))  # seconds, 0 = no expiry
+app.config['RECOGNIZE_BATCH_MAX_FILES'] = int(os.environ.get('RECOGNIZE_BATCH_MAX_FILES', 8))
+# Face workers are per web process: by default split the CPUs across the
+# WEB_CONCURRENCY gunicorn workers instead of giving each process all of them
+app.config['FACE_WORKERS'] = int(os.environ.get(
+    'FACE_WORKERS', max((os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)), 1)
+))  # 0 = run inline
+app.config['FACE_POOL_START_METHOD'] = os.environ.get('FACE_POOL_START_METHOD')  # forkserver | spawn
+app.config['FACE_QUEUE_DEPTH'] = int(os.environ.get('FACE_QUEUE_DEPTH', 0))  # 0 = 2 x workers
+app.config['FACE_QUEUE_TIMEOUT'] = float(os.environ.get('FACE_QUEUE_TIMEOUT', 5))
+app.config['DECODE_MAX_SIDE'] = int(os.environ.get('DECODE_MAX_SIDE', 3200))  # 0 = full resolution
+app.config['DETECT_MAX_SIDE'] = int(os.environ.get('DETECT_MAX_SIDE', 1600))  # 0 = detect on decoded image
+app.config['FACE_ENCODING_MODEL'] = os.environ.get('FACE_ENCODING_MODEL', 'small')  # 'small' | 'large'
+app.config['ANN_N_PROBE'] = int(os.environ.get('ANN_N_PROBE', 8))  # campus search: cells probed per face
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # background recognition jobs
+app.config['JOB_MAX_PENDING'] = int(os.environ.get('JOB_MAX_PENDING', 100))
+app.config['JOB_RESULT_TTL'] = int(os.environ.get('JOB_RESULT_TTL', 600))  # seconds
+app.config['ATTENDANCE_CACHE_TTL'] = float(os.environ.get('ATTENDANCE_CACHE_TTL', 5))  # seconds, 0 = off
+app.config['ATTENDANCE_CACHE_SIZE'] = int(os.environ.get('ATTENDANCE_CACHE_SIZE', 1024))
 
 # ==================== INITIALIZE EXTENSIONS ====================
 db.init_app(app)
 bcrypt.init_app(app)
+gallery_cache.init_app(app)
+face_pool.init_app(app)
+photo_catalog.init_app(app)
+job_queue.init_app(app)
+attendance_cache.init_app(app)
 jwt = JWTManager(app)
 migrate = Migrate(app, db)
 
+with app.app_context():
+    configure_sqlite(db.engine, app.config['SQLITE_BUSY_TIMEOUT'])
+
 # ✅ CORS Configuration
 CORS(app, supports_credentials=True, resources={
     r"/api/*": {
@@ -45,6 +81,18 @@ CORS(app, supports_credentials=True, resources={
 
 # ==================== IMPORT MODELS ====================
 from models import User, Student, Classroom, Attendance
+from routes.attendance import upsert_attendance
+from utils.face_utils import (
+    build_classroom_gallery,
+    classroom_fingerprint,
+    detect_and_encode,
+    face_distance_matrix,
+    collect_matches,
+    build_recognition_result,
+    get_campus_index,
+    ASSIGNMENT_MODES,
+    MATCH_TOLERANCE
+)
 
 # ==================== CUSTOM DECORATORS ====================
 def teacher_required():
@@ -179,42 +227,245 @@ def signup():
         }
     }), 201
 
-# ==================== HELPER FUNCTIONS ====================
-def find_student_image(student):
+# ==================== FACE RECOGNITION PIPELINES ====================
+# Pipelines return (payload, status_code) so they can run either inside the
+# request or as a background job (see /api/recognize/jobs)
+def load_gallery(classroom_id, background=False):
+    """
+    Cached classroom gallery for recognition.
+    Returns (gallery, None) or (None, (error_payload, status)).
+    A cold gallery indexes changed photos on the worker pool; background=True
+    waits for a slot there instead of failing fast with WorkerPoolBusy.
+    """
+    # ✅ Classroom gallery (cached, invalidated on roster/photo changes)
+    gallery = gallery_cache.get(int(classroom_id), partial(build_classroom_gallery, wait=background),
+                                classroom_fingerprint)
+    
+    if gallery is None:
+        return None, ({"error": "No students found in this classroom"}, 400)
+    
+    if not len(gallery):
+        return None, ({
+            "error": "No valid face encodings found",
+            "students_without_photos": gallery.students_without_photos
+        }, 400)
+    
+    print(f"[INFO] Using gallery of {len(gallery)} faces")
+    return gallery, None
+
+def detection_args(image_bytes):
+    return (image_bytes, app.config['DECODE_MAX_SIDE'], app.config['DETECT_MAX_SIDE'],
+            app.config['FACE_ENCODING_MODEL'])
+
+def save_attendance(result, gallery, classroom_id, mark_date):
+    """
+    Recognize-and-mark: write the roster's attendance in one bulk upsert,
+    in the same transaction as the request.
+    Recognized students are marked present. Unrecognized students are only
+    marked absent if they have no record for the date yet, so a second photo
+    of the class never turns an earlier match back to absent. Students
+    without a usable photo can't be recognized and are left unmarked.
+    """
+    recognizable = {int(sid) for sid in gallery.ids}
+    statuses = {sid: 'present' for sid in result["present_ids"]}
+    defaults = {sid: 'absent' for sid in result["absent_ids"] if sid in recognizable}
+    marked, updated = upsert_attendance(classroom_id, mark_date, statuses, defaults)
+    db.session.commit()
+    attendance_cache.invalidate(classroom_id, mark_date)
+    result["attendance_saved"] = {
+        "date": mark_date.isoformat(),
+        "marked": marked,
+        "updated": updated,
+        "unmarked_ids": [sid for sid in result["absent_ids"] if sid not in recognizable]
+    }
+    print(f"[INFO] Attendance saved for {mark_date}: {marked} new, {updated} updated")
+
+def recognize_image(classroom_id, images, assignment, mark_date=None, background=False):
+    """
+    Single photo, images = [(filename, bytes)]: detect faces and match them
+    against the classroom gallery.
+    background=True (async jobs) waits for a worker slot instead of failing fast.
+    """
+    gallery, error = load_gallery(classroom_id, background)
+    if error:
+        return error
+    
+    # ✅ Decode/detect/encode runs on the worker pool, not the request thread
+    encodings, image_info = face_pool.run(detect_and_encode, *detection_args(images[0][1]), wait=background)
+
+    if not encodings:
+        return {"error": "No faces detected in uploaded image"}, 400
+
+    print(f"[INFO] Detected {len(encodings)} faces in uploaded image")
+    
+    # ✅ VECTORIZED MATCHING: one faces x gallery distance matrix
+    distances = face_distance_matrix(encodings, gallery)
+    assignments = ASSIGNMENT_MODES[assignment](distances)
+    
+    result = build_recognition_result(gallery, collect_matches(distances, assignments), len(encodings))
+    result["assignment"] = assignment
+    result.update(image_info)
+    if mark_date:
+        save_attendance(result, gallery, classroom_id, mark_date)
+    return result, 200
+
+def recognize_images(classroom_id, images, assignment, mark_date=None, background=False):
+    """
+    Several photos of one classroom, images = [(filename, bytes), ...].
+    Assignment is one-to-one within each photo; across photos a student
+    seen more than once keeps their best match.
+    """
+    gallery, error = load_gallery(classroom_id, background)
+    if error:
+        return error
+    
+    # ✅ DECODE + DETECT ALL PHOTOS CONCURRENTLY (worker pool)
+    filenames = [filename for filename, _ in images]
+    detected = face_pool.map(detect_and_encode, [detection_args(data) for _, data in images], wait=background)
+    per_image = [encs for encs, _ in detected]
+    
+    total_detected = sum(len(encs) for encs in per_image)
+    if not total_detected:
+        return {"error": "No faces detected in uploaded images"}, 400
+    
+    print(f"[INFO] Detected {total_detected} faces across {len(images)} images")
+    
+    # ✅ ONE DISTANCE MATRIX for every face against the shared gallery
+    distances = face_distance_matrix([e for encs in per_image for e in encs], gallery)
+    
+    best = {}  # gallery_idx -> best match across images
+    seen_in = {}
+    faces = []
+    image_summaries = []
+    offset = 0
+    for image_index, encs in enumerate(per_image):
+        image_distances = distances[offset:offset + len(encs)]
+        matched = {}
+        for match in collect_matches(image_distances, ASSIGNMENT_MODES[assignment](image_distances),
+                                     source_image=filenames[image_index], image_index=image_index):
+            gallery_idx = match["gallery_idx"]
+            matched[match["face_index"]] = int(gallery.ids[gallery_idx])
+            seen_in.setdefault(gallery_idx, []).append(image_index)
+            if gallery_idx not in best or match["distance"] < best[gallery_idx]["distance"]:
+                best[gallery_idx] = match
+        
+        for face_index in range(len(encs)):
+            faces.append({
+                "image_index": image_index,
+                "source_image": filenames[image_index],
+                "face_index": face_index,
+                "student_id": matched.get(face_index)
+            })
+        image_summaries.append({
+            "image_index": image_index,
+            "filename": filenames[image_index],
+            "faces_detected": len(encs),
+            "matched": len(matched),
+            **detected[image_index][1]
+        })
+        offset += len(encs)
+    
+    matches = sorted(best.values(), key=lambda m: (m["image_index"], m["face_index"]))
+    for match in matches:
+        match["seen_in"] = seen_in[match["gallery_idx"]]
+    
+    result = build_recognition_result(gallery, matches, total_detected)
+    result["assignment"] = assignment
+    result["images"] = image_summaries
+    result["faces"] = faces
+    if mark_date:
+        save_attendance(result, gallery, classroom_id, mark_date)
+    return result, 200
+
+def run_pipeline(pipeline, *args, **kwargs):
+    """Run a recognition pipeline, turning failures into (payload, status)"""
+    try:
+        return pipeline(*args, **kwargs)
+    except WorkerPoolBusy as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        db.session.rollback()
+        print(f"[ERROR] Recognition failed: {str(e)}")
+        traceback.print_exc()
+        return {"error": str(e)}, 500
+
+def parse_mark_date(classroom_id):
+    """
+    mark_attendance=1 on a recognize call: validate ownership and the
+    optional date (YYYY-MM-DD, default today).
+    Returns (date or None, error_response or None).
+    """
+    if request.form.get('mark_attendance', '').lower() not in ('1', 'true', 'yes'):
+        return None, None
+    
+    classroom = Classroom.query.get(classroom_id)
+    if not classroom:
+        return None, (jsonify({"error": "Classroom not found"}), 404)
+    if classroom.teacher_id != int(get_jwt_identity()):
+        return None, (jsonify({"error": "Access denied"}), 403)
+    
+    try:
+        raw_date = request.form.get('date')
+        return (datetime.strptime(raw_date, '%Y-%m-%d').date() if raw_date else date.today()), None
+    except ValueError:
+        return None, (jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400)
+
+def spool_uploads(files):
+    """Write uploads to temp files so a queued job holds paths, not image bytes"""
+    spooled = []
+    try:
+        for f in files:
+            fd, path = tempfile.mkstemp(prefix='recognize-', suffix=os.path.splitext(f.filename or '')[1])
+            os.close(fd)
+            spooled.append((f.filename, path))
+            f.save(path)
+    except Exception:
+        remove_spooled(spooled)
+        raise
+    return spooled
+
+def remove_spooled(spooled):
+    for _, path in spooled:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def run_spooled_job(pipeline, classroom_id, spooled, assignment, mark_date):
+    """Background job body: load the spooled photos, run the pipeline, delete the files"""
+    try:
+        images = []
+        for filename, path in spooled:
+            with open(path, 'rb') as f:
+                images.append((filename, f.read()))
+    finally:
+        remove_spooled(spooled)
+    return run_pipeline(pipeline, classroom_id, images, assignment, mark_date, background=True)
+
+def respond(pipeline, classroom_id, files, assignment, mark_date):
     """
-    ✅ SMART IMAGE FINDER - Tries 4 methods
-    1. Exact path from photo_path column
-    2. Name-based matching (john_doe.jpg)
-    3. Roll number-based matching (101.jpg)
-    4. Partial name matching
+    Run a pipeline in the request, or queue it when the client sent async=1
+    (202 + job id; poll GET /api/recognize/jobs/<job_id> for the result).
+    Queued uploads wait on disk until their job starts.
     """
-    images_dir = "images"
-    
-    # Method 1: Exact path
-    if student.photo_path:
-        exact_path = os.path.join(images_dir, student.photo_path)
-        if os.path.exists(exact_path):
-            return exact_path
-    
-    # Method 2: Name-based (spaces replaced by underscores)
-    name_cleaned = student.name.replace(" ", "_").lower()
-    name_pattern = os.path.join(images_dir, f"{name_cleaned}.*")
-    name_matches = glob.glob(name_pattern)
-    if name_matches:
-        return name_matches[0]
-    
-    # Method 3: Roll number-based
-    roll_pattern = os.path.join(images_dir, f"{student.roll_no}.*")
-    roll_matches = glob.glob(roll_pattern)
-    if roll_matches:
-        return roll_matches[0]
-    
-    # Method 4: Case-insensitive partial matching
-    for filename in os.listdir(images_dir):
-        if student.name.lower() in filename.lower() or student.roll_no.lower() in filename.lower():
-            return os.path.join(images_dir, filename)
-    
-    return None
+    if request.form.get('async', '').lower() in ('1', 'true', 'yes'):
+        spooled = spool_uploads(files)
+        try:
+            job_id = job_queue.submit(get_jwt_identity(), run_spooled_job, pipeline,
+                                      classroom_id, spooled, assignment, mark_date)
+        except JobQueueFull as e:
+            remove_spooled(spooled)
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/recognize/jobs/{job_id}"
+        }), 202
+    
+    images = [(f.filename, f.read()) for f in files]
+    payload, status = run_pipeline(pipeline, classroom_id, images, assignment, mark_date)
+    headers = {"Retry-After": "2"} if status == 503 else {}
+    return jsonify(payload), status, headers
 
 # ==================== FACE RECOGNITION (HYBRID - BEST OF BOTH!) ====================
 @app.route("/api/recognize", methods=["POST", "OPTIONS"])
@@ -225,9 +476,21 @@ def recognize():
     ✅ HYBRID FACE RECOGNITION - 95%+ accuracy
     Combines:
     - NEW: Database integration, classroom isolation, smart image finder
+    - NEW: Persistent embedding store (students are not re-encoded per call)
+    - NEW: In-process LRU cache of classroom galleries
+    - NEW: Vectorized distance-matrix matching for all detected faces
+    - NEW: Detection/encoding on a bounded process pool (503 when saturated)
+    - NEW: Reduced-size decode + downscaled detection (scale in response)
     - OLD: Distance-based matching for maximum precision
     
     Requires: JWT token, classroom_id, file (image)
+    Optional: assignment = "greedy" (default) | "optimal"
+              "optimal" solves faces x students jointly (Hungarian) so two
+              similar-looking students can't collapse into one match
+              async = 1 -> 202 with job_id instead of waiting for the result
+              mark_attendance = 1 (+ date, default today) -> also save the
+              result as attendance in one bulk write (present always;
+              absent only for students with no record for the date yet)
     Returns: Present/absent students with accuracy metrics
     """
     if request.method == 'OPTIONS':
@@ -239,127 +502,160 @@ def recognize():
     file = request.files["file"]
     classroom_id = request.form.get('classroom_id')
     
-    if not classroom_id:
+    if not classroom_id or not classroom_id.isdigit():
         return jsonify({"error": "Classroom ID required"}), 400
+    
+    assignment = request.form.get('assignment', 'greedy')
+    if assignment not in ASSIGNMENT_MODES:
+        return jsonify({"error": f"Invalid assignment mode. Use: {', '.join(ASSIGNMENT_MODES)}"}), 400
 
+    mark_date, error = parse_mark_date(int(classroom_id))
+    if error:
+        return error
+
+    return respond(recognize_image, int(classroom_id), [file], assignment, mark_date)
+
+@app.route("/api/recognize/batch", methods=["POST", "OPTIONS"])
+@jwt_required()
+@cross_origin()
+def recognize_batch():
+    """
+    ✅ MULTI-PHOTO RECOGNITION for large halls (3-5 shots covering all rows)
+    
+    Requires: JWT token, classroom_id, files (multiple images)
+    Optional: assignment = "greedy" (default) | "optimal"
+              async = 1 -> 202 with job_id instead of waiting for the result
+              mark_attendance = 1 (+ date, default today) -> also save attendance
+    
+    Photos are decoded and detected concurrently, then every face is matched
+    against one shared gallery. Returns one merged present/absent list;
+    match_details and faces carry the source image of every detection.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    files = [f for f in request.files.getlist('files') if f and f.filename]
+    classroom_id = request.form.get('classroom_id')
+    
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+    
+    max_files = app.config['RECOGNIZE_BATCH_MAX_FILES']
+    if len(files) > max_files:
+        return jsonify({"error": f"Too many files. Maximum {max_files} per batch"}), 400
+    
+    if not classroom_id or not classroom_id.isdigit():
+        return jsonify({"error": "Classroom ID required"}), 400
+    
+    assignment = request.form.get('assignment', 'greedy')
+    if assignment not in ASSIGNMENT_MODES:
+        return jsonify({"error": f"Invalid assignment mode. Use: {', '.join(ASSIGNMENT_MODES)}"}), 400
+
+    mark_date, error = parse_mark_date(int(classroom_id))
+    if error:
+        return error
+
+    return respond(recognize_images, int(classroom_id), files, assignment, mark_date)
+
+@app.route("/api/recognize/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def recognize_job_status(job_id):
+    """
+    Poll an async recognition job.
+    status: queued | running | done | failed; result holds the same payload
+    the synchronous endpoint would have returned (status_code alongside).
+    """
+    job = job_queue.get(job_id)
+    if not job or job["owner_id"] != str(get_jwt_identity()):
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_code": job["status_code"],
+        "result": job["result"],
+        "created_at": datetime.utcfromtimestamp(job["created_at"]).isoformat(),
+        "finished_at": datetime.utcfromtimestamp(job["finished_at"]).isoformat() if job["finished_at"] else None
+    }), 200
+
+@app.route("/api/recognize/search", methods=["POST", "OPTIONS"])
+@cross_origin()
+@teacher_required()
+def recognize_search():
+    """
+    ✅ CAMPUS-WIDE FACE SEARCH ("who is this face anywhere on campus")
+    For cross-listed and guest students not in the current classroom.
+    
+    Requires: JWT token (teacher), file (image)
+    Optional: k (candidates per face, default 3, max 10)
+    Uses an approximate nearest-neighbour (IVF) index over all stored embeddings.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if 'file' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    
     try:
-        # Get all students in classroom
-        classroom_students = Student.query.filter_by(classroom_id=int(classroom_id)).all()
-        
-        if not classroom_students:
-            return jsonify({"error": "No students found in this classroom"}), 400
-        
-        # ✅ BUILD FACE ENCODINGS (classroom-specific)
-        classroom_encodings = []
-        classroom_names = []
-        classroom_ids = []
-        students_without_photos = []
-        
-        print(f"[INFO] Building encodings for {len(classroom_students)} students...")
-        
-        for student in classroom_students:
-            image_path = find_student_image(student)
-            if image_path:
-                try:
-                    img = face_recognition.load_image_file(image_path)
-                    encodings = face_recognition.face_encodings(img)
-                    if len(encodings) > 0:
-                        classroom_encodings.append(encodings[0])
-                        classroom_names.append(student.name)
-                        classroom_ids.append(student.id)
-                        print(f"[SUCCESS] Encoded {student.name}")
-                    else:
-                        students_without_photos.append(student.name)
-                        print(f"[WARNING] No face found in {student.name}'s image")
-                except Exception as e:
-                    students_without_photos.append(student.name)
-                    print(f"[ERROR] Failed to encode {student.name}: {e}")
-            else:
-                students_without_photos.append(student.name)
-                print(f"[WARNING] No image found for {student.name}")
-        
-        if not classroom_encodings:
-            return jsonify({
-                "error": "No valid face encodings found",
-                "students_without_photos": students_without_photos
-            }), 400
+        k = min(max(int(request.form.get('k', 3)), 1), 10)
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    try:
+        index, students = get_campus_index()
+        if not len(index):
+            return jsonify({"error": "No face embeddings stored yet"}), 400
         
-        print(f"[INFO] Successfully encoded {len(classroom_encodings)} faces")
+        encodings, image_info = face_pool.run(detect_and_encode, *detection_args(request.files['file'].read()))
         
-        # ✅ LOAD AND PROCESS UPLOADED IMAGE
-        img = face_recognition.load_image_file(file)
-        face_locations = face_recognition.face_locations(img)
-        encodings = face_recognition.face_encodings(img, face_locations)
-
         if not encodings:
             return jsonify({"error": "No faces detected in uploaded image"}), 400
-
-        print(f"[INFO] Detected {len(encodings)} faces in uploaded image")
         
-        # ✅ HYBRID MATCHING (OLD precision + NEW features)
-        present = []
-        present_ids = []
-        detected_names = set()
-        match_confidences = []  # Track accuracy
-
-        for enc in encodings:
-            # Compare with all classroom students
-            matches = face_recognition.compare_faces(
-                classroom_encodings, 
-                enc, 
-                tolerance=0.6  # Balanced tolerance
-            )
-            
-            # ✅ DISTANCE-BASED MATCHING (from OLD version for precision)
-            distances = face_recognition.face_distance(classroom_encodings, enc)
-            
-            if True in matches and len(distances) > 0:
-                # Get best match using distance scoring
-                best_match_idx = distances.argmin()
-                best_distance = distances[best_match_idx]
-                
-                # Double-check distance threshold
-                if best_distance < 0.6:
-                    name = classroom_names[best_match_idx]
-                    confidence = 1 - best_distance  # Convert to confidence score
-                    
-                    if name not in detected_names:  # Avoid duplicates
-                        detected_names.add(name)
-                        present.append(name)
-                        present_ids.append(classroom_ids[best_match_idx])
-                        match_confidences.append({
-                            "name": name,
-                            "confidence": round(confidence * 100, 2),
-                            "distance": round(best_distance, 3)
-                        })
-                        print(f"[MATCH] {name} - Confidence: {confidence*100:.1f}%")
-
-        # Calculate absent students
-        absent = [s.name for s in classroom_students if s.name not in detected_names]
-        absent_ids = [s.id for s in classroom_students if s.name not in detected_names]
+        faces = []
+        for face_index, (ids, distances) in enumerate(index.search(np.asarray(encodings), k=k)):
+            candidates = []
+            for student_id, distance in zip(ids, distances):
+                distance = float(distance)
+                candidates.append({
+                    **students[int(student_id)],
+                    "distance": round(distance, 3),
+                    "confidence": round((1 - distance) * 100, 2),
+                    "match": distance < MATCH_TOLERANCE
+                })
+            faces.append({"face_index": face_index, "candidates": candidates})
         
-        # Calculate overall accuracy
-        avg_confidence = sum(m['confidence'] for m in match_confidences) / len(match_confidences) if match_confidences else 0
-
         return jsonify({
             "success": True,
-            "present": present,
-            "present_ids": present_ids,
-            "absent": absent,
-            "absent_ids": absent_ids,
-            "total_students": len(classroom_students),
             "total_detected": len(encodings),
-            "students_without_photos": students_without_photos,
-            "match_details": match_confidences,  # ✅ Confidence scores
-            "average_confidence": round(avg_confidence, 2)  # ✅ Overall accuracy
+            "faces": faces,
+            "index": index.stats(),
+            **image_info
         }), 200
 
+    except WorkerPoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "2"}
     except Exception as e:
-        print(f"[ERROR] Recognition failed: {str(e)}")
-        import traceback
+        print(f"[ERROR] Campus search failed: {str(e)}")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/recognize/cache-stats", methods=["GET"])
+@teacher_required()
+def recognize_cache_stats():
+    """Hit/miss/eviction counters of the classroom gallery cache"""
+    stats = gallery_cache.stats()
+    stats["photo_catalog"] = photo_catalog.stats()
+    stats["attendance"] = attendance_cache.stats()
+    return jsonify(stats), 200
+
+@app.route("/api/recognize/pool-stats", methods=["GET"])
+@teacher_required()
+def recognize_pool_stats():
+    """Worker pool occupancy and backpressure counters"""
+    stats = face_pool.stats()
+    stats["jobs"] = job_queue.stats()
+    return jsonify(stats), 200
+
 # ==================== REGISTER BLUEPRINTS ====================
 from routes.classroom import classroom_bp
 from routes.students import student_bp
@@ -395,7 +691,7 @@ def home():
         "features": [
             "95%+ face recognition accuracy",
             "Distance-based precision matching",
-            "Smart image finder (4 methods)",
+            "Smart image finder (indexed photo catalog)",
             "Database-backed student management",
             "JWT authentication",
             "Multi-classroom support",
@@ -406,7 +702,7 @@ def home():
             "classrooms": "/api/classrooms",
             "students": "/api/students",
             "attendance": "/api/attendance",
-            "recognition": "/api/recognize"
+            "recognition": "/api/recognize, /api/recognize/batch, /api/recognize/search"
         }
     })
 
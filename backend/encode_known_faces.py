@@ -1,37 +1,218 @@
 import face_recognition
+import argparse
+import hashlib
+import json
 import os
-import pickle
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 # Known faces directory
 KNOWN_FACES_DIR = "backend/images"
-ENCODINGS_PATH = "backend/encodings.pkl"
+# Gallery = JSON index (names, per-file fingerprints, row offsets) pointing at a
+# contiguous float32 N x 128 .npy matrix that can be memory-mapped read-only
+ENCODINGS_INDEX_PATH = "backend/encodings.json"
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg")
+ENCODING_DIM = 128
+FORMAT_VERSION = 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_file(path):
+    """Worker: first face encoding in an image, or None if no face"""
+    image = face_recognition.load_image_file(path)
+    encodings = face_recognition.face_encodings(image)
+    return encodings[0] if len(encodings) > 0 else None
+
+
+def encode_file_safe(path):
+    """encode_file() returning (encoding, error) so one bad image doesn't fail the run"""
+    try:
+        return encode_file(path), None
+    except Exception as e:
+        return None, str(e)
+
+
+def load_encodings(index_path=ENCODINGS_INDEX_PATH):
+    """
+    Load the gallery without copying it: returns (index, matrix) where matrix
+    is a read-only numpy.memmap of shape (N, 128) and index["names"][i]
+    labels row i. The OS page cache shares the pages across all processes
+    that map the same file.
+    """
+    with open(index_path) as f:
+        index = json.load(f)
+    if index.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported encodings format: {index.get('version')}")
+
+    matrix_path = os.path.join(os.path.dirname(index_path), index["matrix"])
+    matrix = np.load(matrix_path, mmap_mode="r")
+    if matrix.shape != (len(index["names"]), ENCODING_DIM):
+        raise ValueError(f"Encodings matrix {matrix.shape} does not match index")
+    return index, matrix
+
+
+def load_previous():
+    """(files, matrix) from the last run, or ({}, None) if none / unreadable"""
+    if not os.path.exists(ENCODINGS_INDEX_PATH):
+        return {}, None
+    try:
+        index, matrix = load_encodings()
+        return index["files"], matrix
+    except Exception as e:
+        print(f"[WARNING] Could not read previous encodings ({e}), doing a full rebuild")
+        return {}, None
+
+
+def fsync_replace(tmp_path, path):
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
-def encode_faces():
-    known_encodings = []
-    known_names = []
 
-    for filename in os.listdir(KNOWN_FACES_DIR):
-        if filename.endswith((".jpg", ".png", ".jpeg")):
-            path = os.path.join(KNOWN_FACES_DIR, filename)
-            name = os.path.splitext(filename)[0]
+def save_atomic(files, encodings, names):
+    """
+    Write a new matrix under a content-addressed name, then atomically swap
+    the index to point at it. Readers always see a consistent index/matrix
+    pair; a process that still maps the old matrix keeps its pages.
+    """
+    directory = os.path.dirname(os.path.abspath(ENCODINGS_INDEX_PATH))
+    matrix = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    matrix_name = f"encodings-{hashlib.sha256(matrix.tobytes()).hexdigest()[:16]}.npy"
+    matrix_path = os.path.join(directory, matrix_name)
 
-            print(f"[INFO] Encoding {filename}...")
+    previous_matrix = None
+    if os.path.exists(ENCODINGS_INDEX_PATH):
+        try:
+            with open(ENCODINGS_INDEX_PATH) as f:
+                previous_matrix = json.load(f).get("matrix")
+        except Exception:
+            pass
 
-            image = face_recognition.load_image_file(path)
-            encodings = face_recognition.face_encodings(image)
+    tmp_paths = []
+    try:
+        if not os.path.exists(matrix_path):
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".encodings-", suffix=".npy")
+            tmp_paths.append(tmp_path)
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, matrix)
+            fsync_replace(tmp_path, matrix_path)
 
-            if len(encodings) > 0:
-                known_encodings.append(encodings[0])
-                known_names.append(name)
-            else:
-                print(f"[WARNING] No faces found in {filename}")
+        index = {
+            "version": FORMAT_VERSION,
+            "dim": ENCODING_DIM,
+            "dtype": "float32",
+            "matrix": matrix_name,
+            "names": names,
+            "files": files
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".encodings-", suffix=".json")
+        tmp_paths.append(tmp_path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        fsync_replace(tmp_path, ENCODINGS_INDEX_PATH)
+    except BaseException:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+    if previous_matrix and previous_matrix != matrix_name:
+        try:
+            os.remove(os.path.join(directory, previous_matrix))
+        except OSError:
+            pass
+
+
+def encode_faces(full=False, workers=None):
+    """
+    Incrementally (re)build the encodings gallery.
+
+    Every image is fingerprinted by size + mtime; files whose fingerprint is
+    unchanged reuse their previous matrix row. If the stat changed but the
+    sha256 matches (copied / touched file) the row is also reused. Only new
+    or modified images are encoded, in parallel across a process pool.
+    Images that fail to load are recorded with row None and their error,
+    and are retried on the next run.
+    """
+    previous, previous_matrix = ({}, None) if full else load_previous()
+    files = {}
+    encodings = {}
+    to_encode = []
+    filenames = sorted(f for f in os.listdir(KNOWN_FACES_DIR) if f.endswith(IMAGE_EXTENSIONS))
+
+    def reuse(filename, prev, entry):
+        files[filename] = entry
+        if prev.get("row") is not None:
+            encodings[filename] = previous_matrix[prev["row"]]
+
+    for filename in filenames:
+        path = os.path.join(KNOWN_FACES_DIR, filename)
+        stat = os.stat(path)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        prev = previous.get(filename)
+
+        failed_before = prev is not None and "error" in prev
+        if prev and not failed_before and prev["size"] == entry["size"] and prev["mtime"] == entry["mtime"]:
+            reuse(filename, prev, dict(prev))
+            continue
+
+        entry["sha256"] = file_sha256(path)
+        if prev and not failed_before and prev.get("sha256") == entry["sha256"]:
+            entry["row"] = prev.get("row")
+            reuse(filename, prev, entry)
+            continue
+
+        to_encode.append((filename, path, entry))
+
+    removed = len(set(previous) - set(filenames))
+    print(f"[INFO] {len(files)} unchanged, {len(to_encode)} to encode, {removed} removed")
+
+    failed = 0
+    if to_encode:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            paths = [path for _, path, _ in to_encode]
+            for (filename, _, entry), (encoding, error) in zip(to_encode, executor.map(encode_file_safe, paths)):
+                if error:
+                    print(f"[WARNING] Could not encode {filename}: {error}")
+                    entry["error"] = error
+                    failed += 1
+                else:
+                    print(f"[INFO] Encoded {filename}")
+                    if encoding is None:
+                        print(f"[WARNING] No faces found in {filename}")
+                    else:
+                        encodings[filename] = encoding
+                files[filename] = entry
+
+    # Assign contiguous rows (id/offset table) in filename order
+    known_encodings = []
+    known_names = []
+    for filename in sorted(files):
+        if filename in encodings:
+            files[filename]["row"] = len(known_names)
+            known_encodings.append(encodings[filename])
+            known_names.append(os.path.splitext(filename)[0])
+        else:
+            files[filename]["row"] = None
 
     # Save encodings
-    with open(ENCODINGS_PATH, "wb") as f:
-        pickle.dump({"encodings": known_encodings, "names": known_names}, f)
+    save_atomic(files, np.asarray(known_encodings, dtype=np.float32), known_names)
 
-    print(f"[INFO] Encodings saved to {ENCODINGS_PATH}")
+    print(f"[INFO] {len(known_names)} encodings saved to {ENCODINGS_INDEX_PATH}")
+    if failed:
+        print(f"[WARNING] {failed} images could not be encoded and will be retried next run")
 
 if __name__ == "__main__":
-    encode_faces()
-# (yahan poora code paste karo jo maine diya tha)
+    parser = argparse.ArgumentParser(description="Build face encodings for known faces")
+    parser.add_argument("--full", action="store_true", help="ignore previous encodings and re-encode everything")
+    parser.add_argument("--workers", type=int, default=None, help="encoding processes (default: CPU count)")
+    args = parser.parse_args()
+    encode_faces(full=args.full, workers=args.workers)
@@ -3,8 +3,18 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate  # ADD THIS LINE
+from utils.gallery_cache import GalleryCache
+from utils.face_pool import FaceWorkerPool
+from utils.photo_catalog import PhotoCatalog
+from utils.jobs import JobQueue
+from utils.attendance_cache import AttendanceCache
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 jwt = JWTManager()
 migrate = Migrate()  # ADD THIS LINE
+gallery_cache = GalleryCache()
+face_pool = FaceWorkerPool()
+photo_catalog = PhotoCatalog()
+job_queue = JobQueue()
+attendance_cache = AttendanceCache()
@@ -0,0 +1,271 @@
+# backend/migrate_indexes.py
+# Bring an existing database up to the schema in models.py: create tables added
+# since it was initialised (e.g. face_embeddings), then add the composite
+# indexes / unique constraint (db.create_all() never alters existing tables).
+#
+#   python migrate_indexes.py                 # migrate the app database
+#   python migrate_indexes.py --dedupe        # ... deleting duplicate attendance first
+#   python migrate_indexes.py --explain-only  # just print query plans
+#   python migrate_indexes.py --benchmark 2000000
+#       # throwaway SQLite db with N attendance rows, plans + timings before/after
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import MetaData, UniqueConstraint, create_engine, inspect, text
+
+from app import app
+from extensions import db
+from models import Attendance, Classroom, FaceEmbedding, Student
+
+MIGRATED_TABLES = (Classroom.__table__, Student.__table__, Attendance.__table__)
+# Tables added after the first release; created if missing
+NEW_TABLES = (FaceEmbedding.__table__,)
+
+# Hot access paths (see routes/attendance.py, analytics.py, student_portal.py)
+HOT_QUERIES = [
+    ("attendance by classroom + date",
+     "SELECT id, student_id, status FROM attendance WHERE classroom_id = :classroom_id AND date = :date"),
+    ("attendance history by classroom",
+     "SELECT id, student_id, date, status FROM attendance WHERE classroom_id = :classroom_id "
+     "AND date >= :date ORDER BY date DESC"),
+    ("attendance by student",
+     "SELECT id, date, status FROM attendance WHERE student_id = :student_id"),
+    ("attendance by student + classroom",
+     "SELECT id, date, status FROM attendance WHERE student_id = :student_id AND classroom_id = :classroom_id"),
+    ("students by classroom",
+     "SELECT id, name FROM students WHERE classroom_id = :classroom_id"),
+    ("students by user_id",
+     "SELECT id FROM students WHERE user_id = :user_id"),
+    ("students by email",
+     "SELECT id FROM students WHERE email = :email"),
+    ("classrooms by teacher",
+     "SELECT id FROM classrooms WHERE teacher_id = :teacher_id"),
+]
+
+
+def planned_indexes():
+    """[(table, name, columns, unique)] declared in models.py for the migrated tables"""
+    planned = []
+    for table in MIGRATED_TABLES:
+        for index in table.indexes:
+            planned.append((table.name, index.name, [c.name for c in index.columns], bool(index.unique)))
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.name:
+                planned.append((table.name, constraint.name, [c.name for c in constraint.columns], True))
+    return planned
+
+
+def existing_index_names(engine, table_name):
+    inspector = inspect(engine)
+    names = {i["name"] for i in inspector.get_indexes(table_name)}
+    names.update(c["name"] for c in inspector.get_unique_constraints(table_name) if c.get("name"))
+    return names
+
+
+def duplicate_attendance(conn):
+    """(student_id, classroom_id, date, count) groups that block the unique index"""
+    return conn.execute(text(
+        "SELECT student_id, classroom_id, date, COUNT(*) FROM attendance"
+        " GROUP BY student_id, classroom_id, date HAVING COUNT(*) > 1"
+        " ORDER BY classroom_id, date, student_id"
+    )).fetchall()
+
+
+def dedupe_attendance(conn):
+    """Keep the latest record per (student_id, classroom_id, date) so the unique index can be built"""
+    result = conn.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN ("
+        " SELECT MAX(id) FROM attendance GROUP BY student_id, classroom_id, date)"
+    ))
+    return result.rowcount
+
+
+def create_tables(engine):
+    """Create NEW_TABLES that don't exist yet (with their own indexes)"""
+    existing = set(inspect(engine).get_table_names())
+    for table in NEW_TABLES:
+        if table.name in existing:
+            print(f"   table {table.name} already exists")
+            continue
+        db.metadata.create_all(engine, tables=[table])
+        print(f"✅ Created table {table.name}")
+
+
+def create_indexes(engine, dedupe=False):
+    """
+    Create the missing indexes. Duplicate attendance records are only
+    deleted with dedupe=True; otherwise they are listed and False is
+    returned without changing anything.
+    """
+    with engine.begin() as conn:
+        duplicates = duplicate_attendance(conn)
+        if duplicates and not dedupe:
+            print(f"❌ {len(duplicates)} (student_id, classroom_id, date) groups have duplicate attendance:")
+            for student_id, classroom_id, day, count in duplicates:
+                print(f"   student {student_id}, classroom {classroom_id}, {day}: {count} records")
+            print("   Resolve them by hand or re-run with --dedupe to keep the latest record of each group")
+            return False
+        if duplicates:
+            removed = dedupe_attendance(conn)
+            print(f"⚠️  Removed {removed} duplicate attendance records")
+
+    for table_name, name, columns, unique in planned_indexes():
+        if name in existing_index_names(engine, table_name):
+            print(f"   {name} already exists")
+            continue
+        # A unique index is the portable way to add a uniqueness constraint
+        # to an existing table (SQLite has no ALTER TABLE ADD CONSTRAINT)
+        ddl = f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table_name} ({', '.join(columns)})"
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+        print(f"✅ {ddl}")
+    return True
+
+
+def sample_params(conn):
+    """Bind values taken from real rows so plans reflect actual data"""
+    row = conn.execute(text(
+        "SELECT student_id, classroom_id, date FROM attendance ORDER BY id DESC LIMIT 1"
+    )).first()
+    student = conn.execute(text("SELECT user_id, email FROM students ORDER BY id LIMIT 1")).first()
+    classroom = conn.execute(text("SELECT teacher_id FROM classrooms ORDER BY id LIMIT 1")).first()
+    return {
+        "student_id": row[0] if row else 1,
+        "classroom_id": row[1] if row else 1,
+        "date": str(row[2]) if row else date.today().isoformat(),
+        "user_id": student[0] if student and student[0] is not None else 1,
+        "email": student[1] if student else "",
+        "teacher_id": classroom[0] if classroom else 1,
+    }
+
+
+def explain(engine, timings=False):
+    sqlite = engine.dialect.name == "sqlite"
+    with engine.connect() as conn:
+        params = sample_params(conn)
+        for label, sql in HOT_QUERIES:
+            prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+            plan = conn.execute(text(prefix + sql), params).fetchall()
+            steps = [r[-1] if sqlite else r[0] for r in plan]
+            line = f"   {label:<36} {' | '.join(steps)}"
+            if timings:
+                best = float("inf")
+                for _ in range(5):
+                    start = time.perf_counter()
+                    conn.execute(text(sql), params).fetchall()
+                    best = min(best, time.perf_counter() - start)
+                line += f"  [{best * 1000:.2f} ms]"
+            print(line)
+
+
+def legacy_metadata():
+    """The pre-migration schema: migrated tables without the new indexes/constraint"""
+    new_names = {name for _, name, _, _ in planned_indexes()}
+    metadata = MetaData()
+    for table in db.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        if table in MIGRATED_TABLES:
+            copy.indexes.clear()
+            for constraint in list(copy.constraints):
+                if isinstance(constraint, UniqueConstraint) and constraint.name in new_names:
+                    copy.constraints.remove(constraint)
+    return metadata
+
+
+def populate(engine, n_rows, students_per_class=60, n_classrooms=None, seed=0):
+    """Synthetic campus: n_rows attendance records spread over classes and school days"""
+    rng = random.Random(seed)
+    n_classrooms = n_classrooms or max(n_rows // (students_per_class * 180), 1)
+    n_days = max(n_rows // (n_classrooms * students_per_class), 1)
+    n_teachers = max(n_classrooms // 5, 1)
+    start_day = date.today() - timedelta(days=n_days)
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, name, email, password, role) VALUES (:id, :name, :email, 'x', 'teacher')"
+        ), [{"id": t + 1, "name": f"Teacher {t}", "email": f"t{t}@example.com"} for t in range(n_teachers)])
+        conn.execute(text(
+            "INSERT INTO classrooms (id, name, subject, teacher_id) VALUES (:id, :name, 'Subject', :teacher_id)"
+        ), [{"id": c + 1, "name": f"Class {c}", "teacher_id": c % n_teachers + 1} for c in range(n_classrooms)])
+        conn.execute(text(
+            "INSERT INTO students (id, name, email, roll_no, classroom_id) "
+            "VALUES (:id, :name, :email, :roll_no, :classroom_id)"
+        ), [
+            {"id": s + 1, "name": f"Student {s}", "email": f"s{s}@example.com",
+             "roll_no": f"R{s}", "classroom_id": s // students_per_class + 1}
+            for s in range(n_classrooms * students_per_class)
+        ])
+
+        batch = []
+        for day in range(n_days):
+            day_str = (start_day + timedelta(days=day)).isoformat()
+            for s in range(n_classrooms * students_per_class):
+                batch.append({
+                    "student_id": s + 1, "classroom_id": s // students_per_class + 1, "date": day_str,
+                    "status": "present" if rng.random() < 0.85 else "absent"
+                })
+                if len(batch) >= 50000:
+                    conn.execute(text(
+                        "INSERT INTO attendance (student_id, classroom_id, date, status) "
+                        "VALUES (:student_id, :classroom_id, :date, :status)"
+                    ), batch)
+                    batch = []
+        if batch:
+            conn.execute(text(
+                "INSERT INTO attendance (student_id, classroom_id, date, status) "
+                "VALUES (:student_id, :classroom_id, :date, :status)"
+            ), batch)
+    return n_days * n_classrooms * students_per_class
+
+
+def benchmark(n_rows):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        legacy_metadata().create_all(engine)
+        print(f"🌱 Generating ~{n_rows} attendance rows in {path}...")
+        total = populate(engine, n_rows)
+        print(f"   {total} rows\n")
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+        print("📋 Before:")
+        explain(engine, timings=True)
+        print("\n🔧 Migrating:")
+        create_indexes(engine)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        print("\n📋 After:")
+        explain(engine, timings=True)
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add attendance/student indexes to an existing database")
+    parser.add_argument("--explain-only", action="store_true", help="print query plans without migrating")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="delete duplicate attendance records (keeping the latest) before adding the unique index")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS", help="run before/after on a synthetic SQLite db")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        with app.app_context():
+            print("📋 Query plans (before):")
+            explain(db.engine)
+            if not args.explain_only:
+                print("\n🔧 Migrating:")
+                create_tables(db.engine)
+                if not create_indexes(db.engine, dedupe=args.dedupe):
+                    sys.exit(1)
+                print("\n📋 Query plans (after):")
+                explain(db.engine)
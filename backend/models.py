@@ -26,6 +26,9 @@ class User(db.Model):
 
 class Classroom(db.Model):
     __tablename__ = 'classrooms'
+    __table_args__ = (
+        db.Index('ix_classrooms_teacher_id', 'teacher_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -49,6 +52,11 @@ class Classroom(db.Model):
 
 class Student(db.Model):
     __tablename__ = 'students'
+    __table_args__ = (
+        db.Index('ix_students_classroom_id', 'classroom_id'),
+        db.Index('ix_students_user_id', 'user_id'),
+        db.Index('ix_students_email', 'email'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -65,6 +73,7 @@ class Student(db.Model):
     # Relationships
     attendance_records = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan')
     user = db.relationship('User', backref='student_profile', foreign_keys=[user_id])
+    face_embedding = db.relationship('FaceEmbedding', backref='student', uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Student {self.name} - {self.roll_no}>'
@@ -72,6 +81,13 @@ class Student(db.Model):
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        # One record per student per class per day; also serves lookups by
+        # student_id and (student_id, classroom_id) as a left prefix
+        db.UniqueConstraint('student_id', 'classroom_id', 'date', name='uq_attendance_student_classroom_date'),
+        # Per-class register / date-range scans
+        db.Index('ix_attendance_classroom_date', 'classroom_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -82,3 +98,33 @@ class Attendance(db.Model):
     
     def __repr__(self):
         return f'<Attendance {self.student_id} - {self.date} - {self.status}>'
+
+
+class FaceEmbedding(db.Model):
+    __tablename__ = 'face_embeddings'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), unique=True, nullable=False)
+    
+    # Source image the encoding was computed from (used for invalidation)
+    image_path = db.Column(db.String(300), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 of image bytes
+    file_size = db.Column(db.Integer, nullable=True)
+    file_mtime = db.Column(db.Float, nullable=True)
+    
+    encoding = db.Column(db.LargeBinary, nullable=True)  # 128-d float64, NULL if no face found
+    encoding_model = db.Column(db.String(20), nullable=True)  # 'small' / 'large' landmark model
+    
+    # Face location index (decoded image coordinates) + tight crop around it,
+    # so re-encoding only runs the landmark/encoding step on the crop
+    face_top = db.Column(db.Integer, nullable=True)
+    face_right = db.Column(db.Integer, nullable=True)
+    face_bottom = db.Column(db.Integer, nullable=True)
+    face_left = db.Column(db.Integer, nullable=True)
+    crop_top = db.Column(db.Integer, nullable=True)
+    crop_left = db.Column(db.Integer, nullable=True)
+    face_crop = db.Column(db.LargeBinary, nullable=True)  # PNG bytes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FaceEmbedding {self.student_id} - {self.content_hash[:8]}>'
@@ -4,12 +4,13 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from extensions import db
 from models import Attendance, Student, Classroom, User
 from datetime import datetime, timedelta
-from sqlalchemy import func
-import pandas as pd
-import io
+from sqlalchemy import func, case
+from utils.exports import EXPORT_FORMATS, write_export
 
 analytics_bp = Blueprint('analytics', __name__, url_prefix='/api/analytics')
 
+EXPORT_BATCH_SIZE = 1000  # rows fetched per round trip when streaming exports
+
 def teacher_required(fn):
     """Custom decorator to ensure user is a teacher"""
     from functools import wraps
@@ -32,31 +33,33 @@ def get_overview():
     """Get overall statistics for teacher's classrooms"""
     try:
         teacher_id = int(get_jwt_identity())
-        classrooms = Classroom.query.filter_by(teacher_id=teacher_id).all()
-        classroom_ids = [c.id for c in classrooms]
+        classroom_ids = db.session.query(Classroom.id).filter(Classroom.teacher_id == teacher_id)
+        total_classrooms = classroom_ids.count()
         total_students = Student.query.filter(Student.classroom_id.in_(classroom_ids)).count()
         today = datetime.now().strftime('%Y-%m-%d')
-        today_attendance = Attendance.query.filter(
-            Attendance.classroom_id.in_(classroom_ids),
-            Attendance.date == today
-        ).all()
-        present_today = sum(1 for a in today_attendance if a.status == 'present')
-        absent_today = len(today_attendance) - present_today
         thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-        all_attendance = Attendance.query.filter(
+        # Today is inside the 30-day window, so one GROUP BY status covers both
+        status_counts = db.session.query(
+            Attendance.status,
+            func.count(Attendance.id),
+            func.sum(case((Attendance.date == today, 1), else_=0))
+        ).filter(
             Attendance.classroom_id.in_(classroom_ids),
             Attendance.date >= thirty_days_ago
-        ).all()
-        total_records = len(all_attendance)
-        total_present = sum(1 for a in all_attendance if a.status == 'present')
+        ).group_by(Attendance.status).all()
+        total_records = sum(count for _, count, _ in status_counts)
+        total_present = sum(count for status, count, _ in status_counts if status == 'present')
+        total_today = sum(int(count_today or 0) for _, _, count_today in status_counts)
+        present_today = sum(int(count_today or 0) for status, _, count_today in status_counts if status == 'present')
+        absent_today = total_today - present_today
         overall_rate = round((total_present / total_records * 100) if total_records > 0 else 0, 2)
         return jsonify({
             "total_students": total_students,
-            "total_classrooms": len(classrooms),
+            "total_classrooms": total_classrooms,
             "today": {
                 "present": present_today,
                 "absent": absent_today,
-                "total": len(today_attendance)
+                "total": total_today
             },
             "overall_rate": overall_rate,
             "last_30_days": {
@@ -77,37 +80,36 @@ def get_trend():
     try:
         teacher_id = int(get_jwt_identity())
         classroom_id = request.args.get('classroom_id')
-        days = int(request.args.get('days', 7))
+        days = request.args.get('days', '7')
+        if not days.isdigit() or not 1 <= int(days) <= 366:
+            return jsonify({"message": "days must be between 1 and 366"}), 400
+        days = int(days)
         if classroom_id:
             classroom = Classroom.query.filter_by(id=classroom_id, teacher_id=teacher_id).first()
             if not classroom:
                 return jsonify({"message": "Classroom not found or access denied"}), 404
             classroom_ids = [int(classroom_id)]
         else:
-            classrooms = Classroom.query.filter_by(teacher_id=teacher_id).all()
-            classroom_ids = [c.id for c in classrooms]
+            classroom_ids = db.session.query(Classroom.id).filter(Classroom.teacher_id == teacher_id)
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-        attendance_records = Attendance.query.filter(
+        # One row per date, served by the (classroom_id, date) index
+        date_stats = db.session.query(
+            Attendance.date,
+            func.count(Attendance.id).label('total'),
+            func.sum(case((Attendance.status == 'present', 1), else_=0)).label('present')
+        ).filter(
             Attendance.classroom_id.in_(classroom_ids),
             Attendance.date >= start_date
-        ).all()
-        date_stats = {}
-        for record in attendance_records:
-            if record.date not in date_stats:
-                date_stats[record.date] = {"present": 0, "absent": 0, "total": 0}
-            date_stats[record.date]["total"] += 1
-            if record.status == 'present':
-                date_stats[record.date]["present"] += 1
-            else:
-                date_stats[record.date]["absent"] += 1
+        ).group_by(Attendance.date).order_by(Attendance.date).all()
         trend_data = []
-        for date, stats in sorted(date_stats.items()):
+        for row in date_stats:
+            present = int(row.present or 0)
             trend_data.append({
-                "date": date,
-                "present": stats["present"],
-                "absent": stats["absent"],
-                "total": stats["total"],
-                "rate": round((stats["present"] / stats["total"] * 100) if stats["total"] > 0 else 0, 2)
+                "date": row.date,
+                "present": present,
+                "absent": row.total - present,
+                "total": row.total,
+                "rate": round((present / row.total * 100) if row.total > 0 else 0, 2)
             })
         return jsonify(trend_data), 200
     except Exception as e:
@@ -127,18 +129,29 @@ def get_student_analytics():
         classroom = Classroom.query.filter_by(id=classroom_id, teacher_id=teacher_id).first()
         if not classroom:
             return jsonify({"message": "Classroom not found or access denied"}), 404
-        students = Student.query.filter_by(classroom_id=classroom_id).all()
+        # Whole roster in one query; the join condition keeps only this
+        # classroom's records and the outer join keeps students with none
+        present_count = func.sum(case((Attendance.status == 'present', 1), else_=0))
+        rows = db.session.query(
+            Student.id,
+            Student.name,
+            Student.roll_no,
+            Student.email,
+            func.count(Attendance.id).label('total'),
+            present_count.label('present')
+        ).outerjoin(Attendance, (Attendance.student_id == Student.id) & (Attendance.classroom_id == classroom.id)).filter(
+            Student.classroom_id == classroom.id
+        ).group_by(Student.id, Student.name, Student.roll_no, Student.email).order_by(Student.id).all()
         result = []
-        for student in students:
-            records = Attendance.query.filter_by(student_id=student.id).all()
-            total = len(records)
-            present = sum(1 for r in records if r.status == 'present')
+        for row in rows:
+            total = row.total
+            present = int(row.present or 0)
             absent = total - present
             result.append({
-                "student_id": student.id,
-                "name": student.name,
-                "roll_no": student.roll_no,
-                "email": student.email,
+                "student_id": row.id,
+                "name": row.name,
+                "roll_no": row.roll_no,
+                "email": row.email,
                 "total_days": total,
                 "present_days": present,
                 "absent_days": absent,
@@ -154,16 +167,54 @@ def get_student_analytics():
 @analytics_bp.get('/classrooms')
 @teacher_required
 def get_classroom_comparison():
-    """Compare attendance rates across all teacher's classrooms"""
+    """
+    Compare attendance rates across all teacher's classrooms
+    Query params: start_date, end_date (YYYY-MM-DD, optional) restrict the records counted
+    """
     try:
         teacher_id = int(get_jwt_identity())
-        classrooms = Classroom.query.filter_by(teacher_id=teacher_id).all()
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        try:
+            for value in (start_date, end_date):
+                if value:
+                    datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+        
+        classroom_ids = db.session.query(Classroom.id).filter(Classroom.teacher_id == teacher_id)
+        
+        attendance_query = db.session.query(
+            Attendance.classroom_id,
+            func.count(Attendance.id).label('total'),
+            func.sum(case((Attendance.status == 'present', 1), else_=0)).label('present')
+        ).filter(Attendance.classroom_id.in_(classroom_ids))
+        if start_date:
+            attendance_query = attendance_query.filter(Attendance.date >= start_date)
+        if end_date:
+            attendance_query = attendance_query.filter(Attendance.date <= end_date)
+        attendance_stats = attendance_query.group_by(Attendance.classroom_id).subquery()
+        
+        student_counts = db.session.query(
+            Student.classroom_id,
+            func.count(Student.id).label('students')
+        ).filter(Student.classroom_id.in_(classroom_ids)).group_by(Student.classroom_id).subquery()
+        
+        # One round trip: classrooms LEFT JOIN per-classroom aggregates
+        rows = db.session.query(
+            Classroom,
+            func.coalesce(student_counts.c.students, 0),
+            func.coalesce(attendance_stats.c.total, 0),
+            func.coalesce(attendance_stats.c.present, 0)
+        ).outerjoin(
+            student_counts, student_counts.c.classroom_id == Classroom.id
+        ).outerjoin(
+            attendance_stats, attendance_stats.c.classroom_id == Classroom.id
+        ).filter(Classroom.teacher_id == teacher_id).order_by(Classroom.id).all()
+        
         result = []
-        for classroom in classrooms:
-            records = Attendance.query.filter_by(classroom_id=classroom.id).all()
-            total = len(records)
-            present = sum(1 for r in records if r.status == 'present')
-            student_count = Student.query.filter_by(classroom_id=classroom.id).count()
+        for classroom, student_count, total, present in rows:
+            present = int(present)
             result.append({
                 "classroom_id": classroom.id,
                 "name": classroom.name,
@@ -187,12 +238,22 @@ def get_classroom_comparison():
 @analytics_bp.get('/export-excel')
 @teacher_required
 def export_excel():
-    """Export attendance data as Excel"""
+    """
+    Export attendance data as Excel (or CSV with format=csv)
+    Query params: classroom_id, start_date, end_date, format (xlsx | csv)
+    
+    Rows are streamed from the database in batches (yield_per) straight into
+    a write-only workbook / CSV writer backed by a spooled temp file, so
+    memory stays flat however long the date range is.
+    """
     try:
         teacher_id = int(get_jwt_identity())
         classroom_id = request.args.get('classroom_id')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        fmt = request.args.get('format', 'xlsx').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"message": "format must be xlsx or csv"}), 400
         
         query = db.session.query(
             Attendance.date,
@@ -200,7 +261,11 @@ def export_excel():
             Student.roll_no,
             Attendance.status,
             Classroom.name.label('classroom')
-        ).join(Student).join(Classroom).filter(Classroom.teacher_id == int(teacher_id))
+        ).select_from(Attendance).join(
+            Student, Attendance.student_id == Student.id
+        ).join(
+            Classroom, Attendance.classroom_id == Classroom.id
+        ).filter(Classroom.teacher_id == int(teacher_id))
         
         if classroom_id:
             query = query.filter(Classroom.id == int(classroom_id))
@@ -209,26 +274,14 @@ def export_excel():
         if end_date:
             query = query.filter(Attendance.date <= end_date)
         
-        results = query.all()
-        
-        df = pd.DataFrame([{
-            'Date': str(r.date),
-            'Student Name': r.name,
-            'Roll No': r.roll_no,
-            'Status': r.status,
-            'Classroom': r.classroom
-        } for r in results])
-        
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Attendance', index=False)
-        output.seek(0)
+        rows = ((str(r.date), r.name, r.roll_no, r.status, r.classroom) for r in query.yield_per(EXPORT_BATCH_SIZE))
+        output = write_export(fmt, ['Date', 'Student Name', 'Roll No', 'Status', 'Classroom'], rows)
         
         return send_file(
             output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            mimetype=EXPORT_FORMATS[fmt],
             as_attachment=True,
-            download_name=f'attendance_{datetime.now().strftime("%Y%m%d")}.xlsx'
+            download_name=f'attendance_{datetime.now().strftime("%Y%m%d")}.{fmt}'
         )
     except Exception as e:
         print(f"[ERROR] Export Excel failed: {str(e)}")
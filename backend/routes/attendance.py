@@ -2,14 +2,31 @@
 from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from models import Attendance, Student, Classroom, User
-from extensions import db
+from extensions import db, attendance_cache
 from datetime import datetime, date
 import pandas as pd
 from io import BytesIO
+from utils.exports import EXPORT_FORMATS, write_export
+from sqlalchemy import and_, or_, inspect
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
 
 attendance_bp = Blueprint('attendance', __name__, url_prefix='/api/attendance')
 
+# Backends with INSERT ... ON CONFLICT; others fall back to insert + retry
+UPSERT_DIALECTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+UPSERT_CONFLICT_COLUMNS = ['student_id', 'classroom_id', 'date']
+
+# engine -> whether the database has the unique (student_id, classroom_id, date)
+# index. Databases created before it was added (see migrate_indexes.py) don't,
+# and ON CONFLICT needs it. Checked once per engine; restart after migrating.
+_conflict_index = {}
+
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 500
+
 
 def teacher_required(fn):
     """Custom decorator to ensure user is a teacher"""
@@ -31,6 +48,114 @@ def teacher_required(fn):
     return wrapper
 
 
+def has_conflict_index(engine):
+    """True when attendance has a unique index/constraint on UPSERT_CONFLICT_COLUMNS"""
+    if engine not in _conflict_index:
+        inspector = inspect(engine)
+        unique_columns = [i['column_names'] for i in inspector.get_indexes('attendance') if i.get('unique')]
+        unique_columns += [c['column_names'] for c in inspector.get_unique_constraints('attendance')]
+        _conflict_index[engine] = any(sorted(cols) == sorted(UPSERT_CONFLICT_COLUMNS) for cols in unique_columns)
+        if not _conflict_index[engine]:
+            print("[WARN] attendance has no unique (student_id, classroom_id, date) index; "
+                  "run migrate_indexes.py. Falling back to insert + retry")
+    return _conflict_index[engine]
+
+
+def upsert_attendance(classroom_id, attendance_date, statuses, defaults=None, retry=True):
+    """
+    Bulk-write attendance for one classroom and date.
+    statuses: {student_id: 'present' | 'absent'}
+    defaults: {student_id: status} written only for students with no record
+    for the date yet; existing records are left alone (recognize-and-mark
+    uses this for 'absent' so a second photo never undoes an earlier match)
+    
+    Existing rows for (classroom_id, date) are read in ONE query, then new
+    rows are inserted and changed rows updated with one bulk statement each.
+    The insert is an INSERT ... ON CONFLICT DO UPDATE on the
+    (student_id, classroom_id, date) unique index, so a concurrent mark of
+    the same class/date (double submit, recognize-and-mark next to a manual
+    mark) updates the row instead of failing. Databases without that index
+    (not yet migrated) or without ON CONFLICT use a savepoint insert instead.
+    Returns (marked_count, updated_count). Caller commits.
+    """
+    defaults = {sid: status for sid, status in (defaults or {}).items() if sid not in statuses}
+    existing = {
+        student_id: (attendance_id, status)
+        for student_id, attendance_id, status in db.session.query(
+            Attendance.student_id, Attendance.id, Attendance.status
+        ).filter(
+            Attendance.classroom_id == classroom_id,
+            Attendance.date == attendance_date
+        ).all()
+    }
+    
+    def new_row(student_id, status):
+        return {
+            "student_id": student_id,
+            "classroom_id": classroom_id,
+            "date": attendance_date,
+            "status": status,
+            "marked_at": datetime.utcnow()
+        }
+    
+    inserts = []
+    updates = []
+    for student_id, status in statuses.items():
+        if student_id not in existing:
+            inserts.append(new_row(student_id, status))
+        elif existing[student_id][1] != status:
+            updates.append({"id": existing[student_id][0], "status": status})
+    default_inserts = [new_row(sid, status) for sid, status in defaults.items() if sid not in existing]
+    
+    if updates:
+        db.session.bulk_update_mappings(Attendance, updates)
+    if inserts or default_inserts:
+        engine = db.session.get_bind().engine
+        dialect_insert = UPSERT_DIALECTS.get(engine.dialect.name)
+        if dialect_insert and has_conflict_index(engine):
+            if inserts:
+                stmt = dialect_insert(Attendance)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=UPSERT_CONFLICT_COLUMNS,
+                    set_={'status': stmt.excluded.status}
+                )
+                db.session.execute(stmt, inserts)
+            if default_inserts:
+                stmt = dialect_insert(Attendance).on_conflict_do_nothing(index_elements=UPSERT_CONFLICT_COLUMNS)
+                db.session.execute(stmt, default_inserts)
+        else:
+            try:
+                with db.session.begin_nested():
+                    db.session.bulk_insert_mappings(Attendance, inserts + default_inserts)
+            except IntegrityError:
+                if not retry:
+                    raise
+                # Rows appeared since the read: redo against the new state
+                return upsert_attendance(classroom_id, attendance_date, statuses, defaults, retry=False)
+    
+    return len(inserts) + len(default_inserts), len(statuses) - len(inserts)
+
+
+def fetch_attendance_rows(classroom_id, attendance_date):
+    """
+    Attendance for one classroom and date with the student's name and roll
+    number joined in, ordered by roll number: one query instead of a lazy
+    r.student load per record.
+    """
+    return db.session.query(
+        Attendance.id,
+        Attendance.student_id,
+        Student.name,
+        Student.roll_no,
+        Attendance.date,
+        Attendance.status,
+        Attendance.marked_at
+    ).join(Student, Attendance.student_id == Student.id).filter(
+        Attendance.classroom_id == classroom_id,
+        Attendance.date == attendance_date
+    ).order_by(Student.roll_no, Attendance.id).all()
+
+
 # ==================== SAVE ATTENDANCE ====================
 @attendance_bp.route('/mark', methods=['POST'])
 @teacher_required
@@ -72,37 +197,19 @@ def mark_attendance():
     except ValueError:
         return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    # Save attendance records
-    marked_count = 0
-    updated_count = 0
+    try:
+        statuses = {
+            int(record.get('student_id')): record.get('status', 'absent')
+            for record in attendance_records
+        }
+    except (TypeError, ValueError):
+        return jsonify({"message": "Invalid student_id in attendance"}), 400
     
-    for record in attendance_records:
-        student_id = record.get('student_id')
-        status = record.get('status', 'absent')
-        
-        # Check if attendance already exists
-        existing = Attendance.query.filter_by(
-            student_id=student_id,
-            classroom_id=classroom_id,
-            date=attendance_date_obj
-        ).first()
-        
-        if existing:
-            # Update existing record
-            existing.status = status
-            updated_count += 1
-        else:
-            # Create new record
-            new_attendance = Attendance(
-                student_id=student_id,
-                classroom_id=classroom_id,
-                date=attendance_date_obj,
-                status=status
-            )
-            db.session.add(new_attendance)
-            marked_count += 1
+    # Save attendance records (one read + bulk upsert)
+    marked_count, updated_count = upsert_attendance(classroom.id, attendance_date_obj, statuses)
     
     db.session.commit()
+    attendance_cache.invalidate(classroom.id, attendance_date_obj)
     
     return jsonify({
         "message": "Attendance marked successfully",
@@ -144,30 +251,19 @@ def get_attendance_by_classroom(classroom_id):
     except ValueError:
         return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    # ✅ Get attendance records for specific date
-    records = Attendance.query.filter_by(
-        classroom_id=classroom_id,
-        date=date_obj
-    ).all()
-    
-    # ✅ If no records found, return empty array
-    if not records:
-        return jsonify([]), 200
-    
-    # ✅ Build response with student details
-    result = []
-    for r in records:
-        result.append({
+    # ✅ Records for the date with student details (cached briefly: the dashboard polls this)
+    def build():
+        return [{
             "id": r.id,
             "student_id": r.student_id,
-            "student_name": r.student.name,
-            "roll_no": r.student.roll_no,
+            "student_name": r.name,
+            "roll_no": r.roll_no,
             "date": r.date.isoformat(),
             "status": r.status,
-            "marked_at": r.marked_at.isoformat() if hasattr(r, 'marked_at') else None
-        })
+            "marked_at": r.marked_at.isoformat() if r.marked_at else None
+        } for r in fetch_attendance_rows(classroom_id, date_obj)]
     
-    return jsonify(result), 200
+    return jsonify(attendance_cache.get(classroom_id, date_obj, build)), 200
 
 
 # ==================== GET ATTENDANCE HISTORY (OPTIONAL) ====================
@@ -175,8 +271,14 @@ def get_attendance_by_classroom(classroom_id):
 @teacher_required
 def get_attendance_history(classroom_id):
     """
-    Get all attendance records for a classroom (without date filter)
+    Get attendance records for a classroom, newest first, one page at a time
     Useful for analytics/reports
+    Query params: limit (default 100, max 500), cursor (next_cursor of the
+                  previous page), start_date, end_date (YYYY-MM-DD, optional)
+    Returns: {"records": [...], "next_cursor": "YYYY-MM-DD:id" | null}
+    
+    Keyset pagination on (date, id): every page is an index range scan on
+    (classroom_id, date), however deep the client pages.
     """
     user_id = get_jwt_identity()
     
@@ -189,18 +291,69 @@ def get_attendance_history(classroom_id):
     if classroom.teacher_id != int(user_id):
         return jsonify({"message": "Access denied"}), 403
     
-    # Get all records
-    records = Attendance.query.filter_by(classroom_id=classroom_id).order_by(Attendance.date.desc()).all()
-    
-    return jsonify([{
-        "id": r.id,
-        "student_id": r.student_id,
-        "student_name": r.student.name,
-        "student_roll_no": r.student.roll_no,
-        "date": r.date.isoformat(),
-        "status": r.status,
-        "marked_at": r.marked_at.isoformat() if hasattr(r, 'marked_at') else None
-    } for r in records]), 200
+    limit = request.args.get('limit', str(HISTORY_PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= HISTORY_MAX_PAGE_SIZE:
+        return jsonify({"message": f"limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}"}), 400
+    limit = int(limit)
+    
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = cursor.split(':')
+            cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+            cursor_id = int(cursor_id)
+        except ValueError:
+            return jsonify({"message": "Invalid cursor"}), 400
+    
+    # Only the columns the response needs; student fields come from the join
+    query = db.session.query(
+        Attendance.id,
+        Attendance.student_id,
+        Student.name,
+        Student.roll_no,
+        Attendance.date,
+        Attendance.status,
+        Attendance.marked_at
+    ).join(Student, Attendance.student_id == Student.id).filter(
+        Attendance.classroom_id == classroom_id
+    )
+    if start_obj:
+        query = query.filter(Attendance.date >= start_obj)
+    if end_obj:
+        query = query.filter(Attendance.date <= end_obj)
+    if cursor:
+        query = query.filter(or_(
+            Attendance.date < cursor_date,
+            and_(Attendance.date == cursor_date, Attendance.id < cursor_id)
+        ))
+    
+    # One extra row tells us whether another page exists
+    records = query.order_by(Attendance.date.desc(), Attendance.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = f"{records[-1].date.isoformat()}:{records[-1].id}"
+    
+    return jsonify({
+        "records": [{
+            "id": r.id,
+            "student_id": r.student_id,
+            "student_name": r.name,
+            "student_roll_no": r.roll_no,
+            "date": r.date.isoformat(),
+            "status": r.status,
+            "marked_at": r.marked_at.isoformat() if r.marked_at else None
+        } for r in records],
+        "next_cursor": next_cursor
+    }), 200
 
 
 # ==================== EXPORT ATTENDANCE TO EXCEL ====================
@@ -235,10 +388,7 @@ def export_to_excel():
         return jsonify({"message": "Invalid date format"}), 400
     
     # Get attendance records
-    records = Attendance.query.filter_by(
-        classroom_id=classroom_id,
-        date=date_obj
-    ).all()
+    records = fetch_attendance_rows(classroom.id, date_obj)
     
     if not records:
         return jsonify({"message": "No attendance records found"}), 404
@@ -246,10 +396,10 @@ def export_to_excel():
     # Create DataFrame
     data_rows = [{
         "Serial No": idx + 1,
-        "Name": r.student.name,
-        "Roll No": r.student.roll_no,
+        "Name": r.name,
+        "Roll No": r.roll_no,
         "Status": r.status.upper(),
-        "Marked At": r.marked_at.strftime('%Y-%m-%d %H:%M:%S') if hasattr(r, 'marked_at') else 'N/A'
+        "Marked At": r.marked_at.strftime('%Y-%m-%d %H:%M:%S') if r.marked_at else 'N/A'
     } for idx, r in enumerate(records)]
     
     df = pd.DataFrame(data_rows)
@@ -271,6 +421,90 @@ def export_to_excel():
     )
 
 
+# ==================== EXPORT ATTENDANCE REGISTER ====================
+@attendance_bp.route('/export/register', methods=['GET'])
+@teacher_required
+def export_register():
+    """
+    Export the attendance register: one row per student, one column per
+    session date (P / A), plus Present / Absent / Sessions / Attendance %
+    Query params: classroom_id, start_date, end_date (YYYY-MM-DD, optional),
+                  format (xlsx | csv)
+    
+    Only (student_id, date, status) is read from the database; the
+    students x dates grid is a single vectorized pandas pivot.
+    """
+    user_id = get_jwt_identity()
+    classroom_id = request.args.get('classroom_id', '')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    fmt = request.args.get('format', 'xlsx').lower()
+    
+    if not classroom_id.isdigit():
+        return jsonify({"message": "Classroom ID required"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"message": "format must be xlsx or csv"}), 400
+    
+    # Verify classroom
+    classroom = Classroom.query.get(int(classroom_id))
+    
+    if not classroom:
+        return jsonify({"message": "Classroom not found"}), 404
+    
+    if classroom.teacher_id != int(user_id):
+        return jsonify({"message": "Access denied"}), 403
+    
+    try:
+        start_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+    
+    query = db.session.query(Attendance.student_id, Attendance.date, Attendance.status).filter(
+        Attendance.classroom_id == classroom.id
+    )
+    if start_obj:
+        query = query.filter(Attendance.date >= start_obj)
+    if end_obj:
+        query = query.filter(Attendance.date <= end_obj)
+    records = pd.DataFrame(query.all(), columns=['student_id', 'date', 'status'])
+    
+    roster = pd.DataFrame(
+        db.session.query(Student.id, Student.roll_no, Student.name).filter(
+            Student.classroom_id == classroom.id
+        ).order_by(Student.roll_no).all(),
+        columns=['student_id', 'Roll No', 'Name']
+    ).set_index('student_id')
+    
+    records = records.drop_duplicates(['student_id', 'date'], keep='last')
+    records['mark'] = records['status'].str[0].str.upper()
+    grid = records.pivot(index='student_id', columns='date', values='mark').sort_index(axis=1)
+    session_dates = [d.isoformat() for d in grid.columns]
+    grid.columns = session_dates
+    
+    present = records['status'].eq('present').groupby(records['student_id']).sum()
+    sessions = records.groupby('student_id').size()
+    
+    register = roster.join(grid).fillna({d: '-' for d in session_dates})
+    register['Present'] = present.reindex(register.index, fill_value=0).astype(int)
+    register['Sessions'] = sessions.reindex(register.index, fill_value=0).astype(int)
+    register['Absent'] = register['Sessions'] - register['Present']
+    register['Attendance %'] = (
+        register['Present'] / register['Sessions'].where(register['Sessions'] > 0) * 100
+    ).round(2).fillna(0)
+    
+    headers = ['Roll No', 'Name', *session_dates, 'Present', 'Absent', 'Sessions', 'Attendance %']
+    output = write_export(fmt, headers, register[headers].astype(object).values.tolist(), sheet_name='Register')
+    
+    period = f"{start_date or 'start'}_{end_date or date.today().isoformat()}"
+    return send_file(
+        output,
+        mimetype=EXPORT_FORMATS[fmt],
+        as_attachment=True,
+        download_name=f"Register_{classroom.name}_{period}.{fmt}"
+    )
+
+
 # ==================== DELETE ATTENDANCE RECORD ====================
 @attendance_bp.route('/<int:attendance_id>', methods=['DELETE'])
 @teacher_required
@@ -289,7 +523,9 @@ def delete_attendance(attendance_id):
     if classroom.teacher_id != int(user_id):
         return jsonify({"message": "Access denied"}), 403
     
+    cache_key = (attendance.classroom_id, attendance.date)
     db.session.delete(attendance)
     db.session.commit()
+    attendance_cache.invalidate(*cache_key)
     
     return jsonify({"message": "Attendance record deleted"}), 200
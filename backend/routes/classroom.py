@@ -2,7 +2,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from models import Classroom, User, Student
-from extensions import db
+from extensions import db, gallery_cache, attendance_cache
 
 classroom_bp = Blueprint('classroom', __name__, url_prefix='/api/classrooms')
 
@@ -165,6 +165,8 @@ def delete_classroom(classroom_id):
     
     db.session.delete(classroom)
     db.session.commit()
+    gallery_cache.invalidate(classroom_id)
+    attendance_cache.invalidate(classroom_id)
     
     return jsonify({"message": "Classroom deleted successfully"}), 200
 
@@ -270,6 +272,8 @@ def upload_students(classroom_id):
             new_students += 1
 
     db.session.commit()
+    gallery_cache.invalidate(classroom_id)
+    attendance_cache.invalidate(classroom_id)
 
     # ✅ Enhanced response with detailed stats
     return jsonify({
@@ -4,7 +4,9 @@ from flask_cors import cross_origin
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from werkzeug.utils import secure_filename
 from models import Student, Classroom, User
-from extensions import db
+from extensions import db, gallery_cache, photo_catalog, attendance_cache
+from utils.face_utils import refresh_student_embeddings
+from utils.face_pool import WorkerPoolBusy
 import pandas as pd
 import os
 import zipfile
@@ -149,6 +151,7 @@ def bulk_upload_students():
                 })
         
         db.session.commit()
+        gallery_cache.invalidate(classroom_id)
         
         return jsonify({
             "message": f"✅ Upload complete: {len(students_added)} added, {len(students_failed)} failed. Now upload photos via ZIP.",
@@ -198,6 +201,7 @@ def upload_photos_zip():
         uploaded_count = 0
         matched_count = 0
         unmatched = []
+        matched_students = []
         
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             for file_name in zip_ref.namelist():
@@ -231,6 +235,8 @@ def upload_photos_zip():
                 if student:
                     relative_path = os.path.basename(file_name)
                     student.photo_path = relative_path
+                    photo_catalog.register(student, extracted_path)
+                    matched_students.append(student)
                     matched_count += 1
                     print(f"✅ Matched: {file_name} → {student.name} (Roll: {student.roll_no})")
                 else:
@@ -238,23 +244,90 @@ def upload_photos_zip():
                     print(f"❌ Unmatched: {file_name}")
         
         db.session.commit()
+        gallery_cache.invalidate(classroom_id)
         
         try:
             os.remove(zip_path)
         except:
             pass
         
+        # ✅ Encode once at upload time so /api/recognize can reuse it
+        try:
+            no_face = refresh_student_embeddings(matched_students)
+        except WorkerPoolBusy as e:
+            return jsonify({
+                "message": f"Photos saved, but the face check could not run: {e}",
+                "uploaded": uploaded_count,
+                "matched": matched_count,
+                "unmatched": unmatched
+            }), 503, {"Retry-After": "5"}
+        
         return jsonify({
             "message": f"✅ Upload complete: {matched_count}/{uploaded_count} photos matched",
             "uploaded": uploaded_count,
             "matched": matched_count,
-            "unmatched": unmatched
+            "unmatched": unmatched,
+            "no_face": no_face  # ✅ Photos to retake before class
         }), 201
         
     except Exception as e:
         print(f"[ERROR] ZIP upload failed: {str(e)}")
         return jsonify({"message": f"Upload failed: {str(e)}"}), 500
 
+# ==================== UPLOAD SINGLE PHOTO ====================
+@student_bp.route('/<int:student_id>/photo', methods=['POST', 'OPTIONS'])
+@cross_origin(origins=["http://localhost:5173"], supports_credentials=True)
+@teacher_required
+def upload_student_photo(student_id):
+    """
+    Upload / replace one student's photo (form field: file)
+    The face is detected and indexed immediately, so a photo without a
+    usable face is flagged now instead of during a live class.
+    """
+    user_id = get_jwt_identity()
+    student = Student.query.get(student_id)
+    if not student:
+        return jsonify({"message": "Student not found"}), 404
+    classroom = Classroom.query.get(student.classroom_id)
+    if classroom.teacher_id != int(user_id):
+        return jsonify({"message": "Access denied"}), 403
+    
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({"message": "No file uploaded"}), 400
+    if not allowed_image_file(file.filename):
+        return jsonify({"message": "Only .jpg, .jpeg and .png files allowed"}), 400
+    
+    try:
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        filename = secure_filename(f"{student.roll_no}.{extension}")
+        file.save(os.path.join(UPLOAD_FOLDER, filename))
+        
+        student.photo_path = filename
+        db.session.commit()
+        photo_catalog.register(student, os.path.join(UPLOAD_FOLDER, filename))
+        gallery_cache.invalidate(student.classroom_id)
+        
+        try:
+            no_face = refresh_student_embeddings([student])
+        except WorkerPoolBusy as e:
+            return jsonify({
+                "message": f"Photo saved, but the face check could not run: {e}",
+                "photo_path": filename
+            }), 503, {"Retry-After": "5"}
+        
+        face_found = not no_face
+        return jsonify({
+            "message": "✅ Photo uploaded" if face_found else "⚠️ Photo uploaded but no face was detected",
+            "photo_path": filename,
+            "face_found": face_found
+        }), 201
+        
+    except Exception as e:
+        print(f"[ERROR] Photo upload failed: {str(e)}")
+        return jsonify({"message": f"Upload failed: {str(e)}"}), 500
+
 # ==================== UPDATE STUDENT ====================
 @student_bp.route('/<int:student_id>', methods=['PUT'])
 @teacher_required
@@ -274,9 +347,18 @@ def update_student(student_id):
         student.email = data.get('email')
     if data.get('roll_no'):
         student.roll_no = data.get('roll_no')
+    photo_changed = bool(data.get('photo_path')) and data.get('photo_path') != student.photo_path
     if data.get('photo_path'):
         student.photo_path = data.get('photo_path')
     db.session.commit()
+    if photo_changed:
+        try:
+            refresh_student_embeddings([student])
+        except WorkerPoolBusy:
+            # Indexed on the next gallery build instead
+            print(f"[WARNING] Workers busy, {student.name}'s photo not indexed yet")
+    gallery_cache.invalidate(student.classroom_id)
+    attendance_cache.invalidate(student.classroom_id)
     return jsonify({
         "message": "Student updated successfully",
         "student": {
@@ -301,4 +383,6 @@ def delete_student(student_id):
         return jsonify({"message": "Access denied"}), 403
     db.session.delete(student)
     db.session.commit()
+    gallery_cache.invalidate(classroom.id)
+    attendance_cache.invalidate(classroom.id)
     return jsonify({"message": "Student deleted successfully"}), 200
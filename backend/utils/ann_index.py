@@ -0,0 +1,111 @@
+# backend/utils/ann_index.py
+# In-process IVF (inverted file) index for approximate nearest-neighbour face search
+import numpy as np
+
+
+def squared_distances(queries, vectors, vector_sq_norms):
+    """(Q, N) squared Euclidean distances via ||a||^2 + ||b||^2 - 2 a.b"""
+    query_sq = np.einsum('ij,ij->i', queries, queries)
+    d = query_sq[:, None] + vector_sq_norms[None, :] - 2.0 * (queries @ vectors.T)
+    return np.maximum(d, 0, out=d)
+
+
+class IVFIndex:
+    """
+    Coarse k-means quantizer + inverted lists.
+
+    Vectors are clustered into n_lists cells (default sqrt(N)) and stored
+    contiguously cell by cell. A query is compared to the centroids first
+    and then exhaustively to the vectors of its n_probe nearest cells only,
+    so a search touches roughly n_probe / n_lists of the gallery.
+    With n_probe >= n_lists the search is exact.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, train_iters=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.sq_norms = None
+        self.offsets = None
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def _nearest_centroid(self, x, chunk=8192):
+        centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        out = np.empty(len(x), dtype=np.int64)
+        for start in range(0, len(x), chunk):
+            block = x[start:start + chunk]
+            out[start:start + chunk] = squared_distances(block, self.centroids, centroid_sq).argmin(axis=1)
+        return out
+
+    def build(self, vectors, ids):
+        """vectors: (N, D) array, ids: N labels returned by search()"""
+        x = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids)
+        n = len(x)
+        rng = np.random.default_rng(self.seed)
+
+        n_lists = min(self.n_lists or max(int(np.sqrt(n)), 1), max(n, 1))
+        if n == 0:
+            self.centroids = np.zeros((1, x.shape[1]), dtype=np.float32)
+        else:
+            # Train the quantizer on a sample (64 points per cell is plenty)
+            sample = x[rng.choice(n, min(n, n_lists * 64), replace=False)]
+            self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+            for _ in range(self.train_iters):
+                assign = self._nearest_centroid(sample)
+                sums = np.zeros_like(self.centroids)
+                np.add.at(sums, assign, sample)
+                counts = np.bincount(assign, minlength=n_lists)
+                filled = counts > 0  # empty cells keep their previous centroid
+                self.centroids[filled] = sums[filled] / counts[filled, None]
+
+        assign = self._nearest_centroid(x) if n else np.empty(0, dtype=np.int64)
+        order = np.argsort(assign, kind='stable')
+        self.vectors = x[order]
+        self.ids = ids[order]
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.offsets = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        return self
+
+    def search(self, queries, k=1, n_probe=None):
+        """
+        k nearest gallery entries for every query.
+        Returns a list (one per query) of (ids, distances) arrays, nearest first.
+        """
+        q = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        n_lists = len(self.centroids)
+        n_probe = min(n_probe or self.n_probe, n_lists)
+
+        centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        centroid_d = squared_distances(q, self.centroids, centroid_sq)
+        if n_probe < n_lists:
+            probes = np.argpartition(centroid_d, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(n_lists), (len(q), n_lists))
+
+        results = []
+        for qi in range(len(q)):
+            candidates = np.concatenate([
+                np.arange(self.offsets[cell], self.offsets[cell + 1]) for cell in probes[qi]
+            ])
+            if len(candidates) == 0:
+                results.append((self.ids[:0], np.empty(0, dtype=np.float32)))
+                continue
+            d = squared_distances(q[qi:qi + 1], self.vectors[candidates], self.sq_norms[candidates])[0]
+            top = np.argpartition(d, k - 1)[:k] if k < len(d) else np.arange(len(d))
+            top = top[np.argsort(d[top])]
+            results.append((self.ids[candidates[top]], np.sqrt(d[top])))
+        return results
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "n_lists": 0 if self.centroids is None else len(self.centroids),
+            "n_probe": self.n_probe
+        }
@@ -0,0 +1,84 @@
+# backend/utils/attendance_cache.py
+# Short-TTL in-process cache of per-(classroom, date) attendance responses
+import threading
+import time
+from collections import OrderedDict
+
+
+class AttendanceCache:
+    """
+    TTL + LRU cache keyed by (classroom_id, date).
+
+    Absorbs dashboard polling of the same classroom/date. Writes call
+    invalidate() after committing; as in GalleryCache, version counters
+    make sure a response built while an invalidation happened is not
+    stored. The TTL bounds staleness across processes, which each keep
+    their own cache. ttl = 0 disables caching.
+    """
+
+    def __init__(self, ttl=5, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (classroom_id, date) -> (versions, expires_at, value)
+        self._versions = {}  # classroom_id or (classroom_id, date) -> counter
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('ATTENDANCE_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('ATTENDANCE_CACHE_SIZE', self.max_size)
+
+    def _key_versions(self, key):
+        return self._versions.get(key[0], 0), self._versions.get(key, 0)
+
+    def get(self, classroom_id, attendance_date, builder):
+        """Return the cached value or build it with builder()"""
+        if not self.ttl:
+            return builder()
+
+        key = (int(classroom_id), attendance_date)
+        with self._lock:
+            versions = self._key_versions(key)
+            entry = self._entries.get(key)
+            if entry and entry[0] == versions and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = builder()
+
+        with self._lock:
+            if self._key_versions(key) == versions:
+                self._entries[key] = (versions, time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, classroom_id, attendance_date=None):
+        """Drop one date of a classroom, or every date when attendance_date is None"""
+        if classroom_id is None:
+            return
+        classroom_id = int(classroom_id)
+        version_key = classroom_id if attendance_date is None else (classroom_id, attendance_date)
+        with self._lock:
+            self._versions[version_key] = self._versions.get(version_key, 0) + 1
+            for key in [k for k in self._entries if k[0] == classroom_id and
+                        (attendance_date is None or k[1] == attendance_date)]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits / lookups * 100) if lookups > 0 else 0, 2)
+            }
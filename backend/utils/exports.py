@@ -0,0 +1,50 @@
+# backend/utils/exports.py
+# Constant-memory spreadsheet exports: rows are written one at a time into a
+# spooled temp file (RAM up to spool_size, then disk) and sent from there
+import csv
+import io
+import tempfile
+from openpyxl import Workbook
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def write_xlsx(headers, rows, sheet_name='Attendance', spool_size=SPOOL_SIZE):
+    """
+    openpyxl write-only workbook: each appended row is serialized straight
+    to the sheet's XML stream instead of being kept as cell objects.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+
+    output = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def write_csv(headers, rows, spool_size=SPOOL_SIZE):
+    output = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    # utf-8-sig so Excel detects the encoding of non-ASCII names
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(headers)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+    output.seek(0)
+    return output
+
+
+def write_export(fmt, headers, rows, sheet_name='Attendance'):
+    """Spooled file for fmt ('xlsx' | 'csv'), positioned at the start"""
+    if fmt == 'csv':
+        return write_csv(headers, rows)
+    return write_xlsx(headers, rows, sheet_name)
@@ -0,0 +1,143 @@
+# backend/utils/face_pool.py
+# Process pool for CPU-heavy face detection / encoding (dlib holds the GIL)
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class WorkerPoolBusy(Exception):
+    """Raised when the pool queue is full and no slot freed up in time"""
+
+
+class WorkerCrashed(WorkerPoolBusy):
+    """Raised when a worker died mid-job (segfault, OOM kill); the pool is rebuilt"""
+
+
+class FaceWorkerPool:
+    """
+    Bounded process pool for the recognition hot path.
+
+    At most queue_depth jobs may be queued or running at once. Callers wait
+    up to queue_timeout seconds for a slot and then get WorkerPoolBusy, so a
+    burst of requests is pushed back to the client (503) instead of piling up.
+    Background jobs pass wait=True and queue for a slot without a timeout:
+    their backpressure is the job queue's own limit.
+    workers=0 runs jobs inline in the request thread (useful for debugging).
+
+    Workers are started with 'forkserver' ('spawn' where unavailable), never
+    a plain fork of the multithreaded web process: a fork taken while a
+    request or job thread holds a lock can deadlock the child. The fork
+    server preloads this module's face_recognition/dlib import once.
+
+    A worker that dies (dlib segfault, OOM kill on a huge upload) breaks the
+    whole ProcessPoolExecutor. The failed call gets WorkerCrashed (503) and
+    the broken executor is dropped so the next call starts a fresh pool.
+    """
+
+    def __init__(self, workers=None, queue_depth=None, queue_timeout=5, start_method=None):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.start_method = start_method
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.crashed = 0
+
+    def init_app(self, app):
+        self.workers = app.config.get('FACE_WORKERS', os.cpu_count() or 1)
+        self.queue_depth = app.config.get('FACE_QUEUE_DEPTH') or max(self.workers, 1) * 2
+        self.queue_timeout = app.config.get('FACE_QUEUE_TIMEOUT', self.queue_timeout)
+        self.start_method = app.config.get('FACE_POOL_START_METHOD') or self.start_method
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                method = self.start_method or ('forkserver' if 'forkserver' in methods else 'spawn')
+                context = multiprocessing.get_context(method)
+                if method == 'forkserver':
+                    context.set_forkserver_preload(['utils.face_utils'])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Forget a broken executor so _get_executor builds a new one"""
+        with self._lock:
+            if self._executor is not executor:
+                return  # another thread already replaced it
+            self._executor = None
+            self.crashed += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self, wait=False):
+        if not self._slots.acquire(timeout=None if wait else self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise WorkerPoolBusy("Recognition workers are busy, please retry")
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def run(self, fn, *args, wait=False):
+        """Run fn(*args) on a worker and wait for the result"""
+        return self.map(fn, [args], wait=wait)[0]
+
+    def map(self, fn, arg_tuples, wait=False):
+        """
+        Run fn(*args) for every args tuple concurrently; results in input order.
+        wait=True blocks until slots free up instead of raising WorkerPoolBusy.
+        """
+        if not self.workers:
+            return [fn(*args) for args in arg_tuples]
+
+        executor = self._get_executor()
+        futures = []
+        try:
+            for args in arg_tuples:
+                self._acquire(wait)
+                try:
+                    future = executor.submit(fn, *args)
+                except Exception:
+                    self._release()
+                    raise
+                future.add_done_callback(self._release)
+                futures.append(future)
+            return [future.result() for future in futures]
+        except WorkerPoolBusy:
+            for future in futures:
+                future.cancel()
+            raise
+        except BrokenProcessPool as e:
+            for future in futures:
+                future.cancel()
+            self._discard_executor(executor)
+            raise WorkerCrashed("A recognition worker crashed, please retry") from e
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "crashed": self.crashed
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
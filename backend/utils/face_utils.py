@@ -0,0 +1,647 @@
+# backend/utils/face_utils.py
+# Face encoding helpers shared by recognition and photo upload routes
+import os
+import hashlib
+import threading
+from io import BytesIO
+import numpy as np
+import face_recognition
+from PIL import Image
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from extensions import db, photo_catalog, gallery_cache, face_pool
+from utils.face_pool import WorkerPoolBusy
+from models import FaceEmbedding, Student, Classroom
+from utils.ann_index import IVFIndex
+
+MATCH_TOLERANCE = 0.6  # Balanced tolerance
+CROP_MARGIN = 0.5  # context kept around the face box, as a fraction of its size
+
+
+def find_student_image(student):
+    """
+    ✅ SMART IMAGE FINDER - name / roll number / partial matching
+    Resolved through the in-memory photo catalog: O(1) per student instead
+    of globbing and listing the images directory on every call.
+    """
+    return photo_catalog.resolve(student)
+
+
+def file_content_hash(path):
+    """sha256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encoding_to_bytes(encoding):
+    return np.asarray(encoding, dtype=np.float64).tobytes()
+
+
+def bytes_to_encoding(raw):
+    return np.frombuffer(raw, dtype=np.float64)
+
+
+def encoding_model():
+    """Landmark model used for encodings ('small' = 5-point, 'large' = 68-point)"""
+    return current_app.config.get('FACE_ENCODING_MODEL', 'small')
+
+
+def crop_face(img, location, margin=CROP_MARGIN):
+    """Tight crop around a (top, right, bottom, left) box. Returns (crop, (crop_top, crop_left))"""
+    top, right, bottom, left = location
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    crop_top = max(top - pad_y, 0)
+    crop_left = max(left - pad_x, 0)
+    crop = img[crop_top:min(bottom + pad_y, img.shape[0]), crop_left:min(right + pad_x, img.shape[1])]
+    return crop, (crop_top, crop_left)
+
+
+def encode_face_crop(record, model=None):
+    """Re-encode a stored embedding from its crop only (no detection pass)"""
+    crop = np.array(Image.open(BytesIO(record.face_crop)).convert('RGB'))
+    location = (
+        record.face_top - record.crop_top,
+        record.face_right - record.crop_left,
+        record.face_bottom - record.crop_top,
+        record.face_left - record.crop_left
+    )
+    return face_recognition.face_encodings(crop, [location], model=model or encoding_model())[0]
+
+
+def index_face_image(image_bytes, decode_max_side=None, detect_max_side=None, model='small'):
+    """
+    Worker-side enrollment indexing: decode, detect (on the downscaled copy
+    used for recognition), crop and encode the largest face of a portrait.
+    Takes and returns plain values so it can run on the process pool.
+    Returns None if no face is found, else a dict with the face box and
+    crop offset (decoded image coordinates), the PNG crop and the encoding.
+    """
+    img, _ = load_image_for_detection(image_bytes, decode_max_side)
+    locations = detect_faces(img, detect_max_side)[0]
+    if not locations:
+        return None
+
+    location = max(locations, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+    crop, crop_offset = crop_face(img, location)
+    buffer = BytesIO()
+    Image.fromarray(crop).save(buffer, format='PNG')
+    return {
+        "location": [int(v) for v in location],
+        "crop_offset": [int(v) for v in crop_offset],
+        "face_crop": buffer.getvalue(),
+        "encoding": encoding_to_bytes(face_recognition.face_encodings(img, [location], model=model)[0])
+    }
+
+
+def index_face_image_safe(*args):
+    """index_face_image() returning (result, error) so one bad photo doesn't fail a batch"""
+    try:
+        return index_face_image(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+def index_face_args(image_path, model):
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    return (image_bytes, current_app.config.get('DECODE_MAX_SIDE'),
+            current_app.config.get('DETECT_MAX_SIDE'), model)
+
+
+def apply_face_index(record, indexed, model):
+    """Store an index_face_image() result on a FaceEmbedding row"""
+    record.encoding_model = model
+    if indexed is None:
+        record.encoding = None
+        record.face_top = record.face_right = record.face_bottom = record.face_left = None
+        record.crop_top = record.crop_left = None
+        record.face_crop = None
+        return
+
+    record.face_top, record.face_right, record.face_bottom, record.face_left = indexed["location"]
+    record.crop_top, record.crop_left = indexed["crop_offset"]
+    record.face_crop = indexed["face_crop"]
+    record.encoding = indexed["encoding"]
+
+
+def prepare_student_embedding(student):
+    """
+    Resolve the stored FaceEmbedding for a student without running detection.
+
+    The row is reused as long as the resolved image path and its size/mtime
+    are unchanged. If the stat changed, the file is re-hashed and only
+    re-indexed when the bytes actually differ. If only the configured
+    encoding model changed, the stored crop is re-encoded (no detection).
+
+    Returns (record, image_path_to_index). record is None if no image exists
+    for the student; image_path_to_index is set when the image still has to
+    go through index_face_image().
+    """
+    image_path = find_student_image(student)
+    record = student.face_embedding
+    model = encoding_model()
+
+    if not image_path:
+        if record:
+            db.session.delete(record)
+        return None, None
+
+    stat = os.stat(image_path)
+    if (record and record.image_path == image_path
+            and record.file_size == stat.st_size
+            and record.file_mtime == stat.st_mtime):
+        content_hash = record.content_hash
+    else:
+        content_hash = file_content_hash(image_path)
+
+    if record is None:
+        record = FaceEmbedding(student_id=student.id)
+        student.face_embedding = record
+    elif record.content_hash == content_hash:
+        # Same bytes (possibly under a new path / touched file): keep the index
+        record.image_path = image_path
+        record.file_size = stat.st_size
+        record.file_mtime = stat.st_mtime
+        if record.encoding is not None and record.encoding_model != model:
+            if record.face_crop is None:
+                return record, image_path
+            record.encoding = encoding_to_bytes(encode_face_crop(record, model))
+            record.encoding_model = model
+            print(f"[INFO] Re-encoded {student.name} with '{model}' model")
+        return record, None
+
+    record.image_path = image_path
+    record.content_hash = content_hash
+    record.file_size = stat.st_size
+    record.file_mtime = stat.st_mtime
+    return record, image_path
+
+
+def ensure_student_embeddings(students, wait=False):
+    """
+    Bring the embedding store up to date for many students at once.
+    Photos that need detection are indexed concurrently on the worker pool;
+    only the row updates happen in this thread. Like any request-path pool
+    call this raises WorkerPoolBusy when no slot frees up in time;
+    wait=True (background jobs) queues for slots instead.
+
+    Returns ({student_id: record or None}, {student_id: error message}).
+    A record with encoding=None means the image has no detectable face.
+    Caller is responsible for db.session.commit().
+    """
+    model = encoding_model()
+    records = {}
+    errors = {}
+    pending = []
+    for student in students:
+        try:
+            record, image_path = prepare_student_embedding(student)
+            records[student.id] = record
+            if image_path:
+                pending.append((student, record, index_face_args(image_path, model)))
+        except Exception as e:
+            records[student.id] = None
+            errors[student.id] = str(e)
+            print(f"[ERROR] Failed to encode {student.name}: {e}")
+
+    if pending:
+        try:
+            results = face_pool.map(index_face_image_safe, [args for _, _, args in pending], wait=wait)
+        except WorkerPoolBusy:
+            # Rows already carry the new photo's hash: never commit them unindexed
+            db.session.rollback()
+            raise
+        for (student, record, _), (indexed, error) in zip(pending, results):
+            if error:
+                records[student.id] = None
+                errors[student.id] = error
+                print(f"[ERROR] Failed to encode {student.name}: {error}")
+                continue
+            apply_face_index(record, indexed, model)
+            print(f"[INFO] Stored face embedding for {student.name}")
+    return records, errors
+
+
+def commit_embeddings():
+    """
+    Commit embeddings computed in this session. Returns False (after a
+    rollback) if a concurrent request stored a row for the same student
+    first; the caller then retries and reuses that row.
+    """
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def refresh_student_embeddings(students, wait=False, retry=True):
+    """
+    Populate the embedding store for freshly uploaded photos.
+    Returns names of students whose photo is missing or has no detectable
+    face, so it can be flagged at upload time rather than during class.
+    """
+    records, _ = ensure_student_embeddings(students, wait=wait)
+    failed = [student.name for student in students
+              if records.get(student.id) is None or records[student.id].encoding is None]
+    if not commit_embeddings() and retry:
+        return refresh_student_embeddings(students, wait=wait, retry=False)
+    return failed
+
+
+class ClassroomGallery:
+    """
+    Snapshot of a classroom's known faces used for matching.
+    encodings is a contiguous (N, 128) matrix aligned with ids / names;
+    roster holds (id, name) for every student so absentees can be listed.
+    """
+
+    def __init__(self, classroom_id, roster, encodings, ids, names, students_without_photos):
+        self.classroom_id = classroom_id
+        self.roster = roster
+        self.encodings = encodings
+        self.sq_norms = np.einsum('ij,ij->i', encodings, encodings)  # reused by every match
+        self.ids = ids
+        self.names = names
+        self.students_without_photos = students_without_photos
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def classroom_fingerprint(classroom_id):
+    """
+    One roster-sized query that changes whenever the roster, a student's
+    name / roll number / photo path, or any stored embedding of the
+    classroom changes; lets every process detect writes made by other
+    processes before reusing its cached gallery. The rows are hashed so the
+    cache keeps a short digest, not the roster.
+    """
+    rows = db.session.query(
+        Student.id,
+        Student.name,
+        Student.roll_no,
+        Student.photo_path,
+        FaceEmbedding.id,
+        FaceEmbedding.updated_at
+    ).outerjoin(FaceEmbedding, FaceEmbedding.student_id == Student.id).filter(
+        Student.classroom_id == classroom_id
+    ).order_by(Student.id).all()
+    return hashlib.sha1(repr([tuple(row) for row in rows]).encode('utf-8')).hexdigest()
+
+
+def build_classroom_gallery(classroom_id, wait=False, retry=True):
+    """
+    Load a classroom's students and stored embeddings into a ClassroomGallery.
+    wait is passed to ensure_student_embeddings (True for background jobs).
+    """
+    students = Student.query.options(
+        joinedload(Student.face_embedding)
+    ).filter_by(classroom_id=classroom_id).all()
+
+    if not students:
+        return None
+
+    print(f"[INFO] Building gallery for {len(students)} students...")
+
+    encodings = []
+    ids = []
+    names = []
+    students_without_photos = []
+
+    # ✅ Reuse stored embeddings; changed photos are re-indexed on the worker pool
+    records, errors = ensure_student_embeddings(students, wait=wait)
+
+    for student in students:
+        record = records.get(student.id)
+        if student.id in errors:
+            students_without_photos.append(student.name)
+        elif record is None:
+            students_without_photos.append(student.name)
+            print(f"[WARNING] No image found for {student.name}")
+        elif record.encoding is None:
+            students_without_photos.append(student.name)
+            print(f"[WARNING] No face found in {student.name}'s image")
+        else:
+            encodings.append(bytes_to_encoding(record.encoding))
+            ids.append(student.id)
+            names.append(student.name)
+
+    # Persist any embeddings computed while building
+    if not commit_embeddings() and retry:
+        return build_classroom_gallery(classroom_id, wait=wait, retry=False)
+
+    if encodings:
+        matrix = np.ascontiguousarray(np.vstack(encodings), dtype=np.float64)
+    else:
+        matrix = np.empty((0, 128), dtype=np.float64)
+
+    return ClassroomGallery(
+        classroom_id=classroom_id,
+        roster=[(s.id, s.name) for s in students],
+        encodings=matrix,
+        ids=np.asarray(ids, dtype=np.int64),
+        names=names,
+        students_without_photos=students_without_photos
+    )
+
+
+# ==================== DETECTION ====================
+def load_image_for_detection(image_bytes, decode_max_side=None):
+    """
+    Decode an uploaded photo to an RGB array, capped at decode_max_side.
+    JPEGs use draft mode so the decoder itself downsamples (1/2, 1/4, 1/8 DCT
+    scaling) instead of inflating a 48 MP frame first.
+    Returns (array, decode_scale) where decode_scale = decoded / original size.
+    """
+    im = Image.open(BytesIO(image_bytes))
+    original_side = max(im.size)
+
+    if decode_max_side and original_side > decode_max_side:
+        im.draft('RGB', (decode_max_side, decode_max_side))  # no-op for non-JPEG
+        im = im.convert('RGB')
+        if max(im.size) > decode_max_side:
+            im.thumbnail((decode_max_side, decode_max_side), Image.BILINEAR)
+    else:
+        im = im.convert('RGB')
+
+    return np.array(im), max(im.size) / original_side
+
+
+def scale_locations(locations, scale, shape):
+    """Map (top, right, bottom, left) boxes found at `scale` back onto an image of `shape`"""
+    height, width = shape[:2]
+    return [(
+        max(int(top / scale), 0),
+        min(int(round(right / scale)), width - 1),
+        min(int(round(bottom / scale)), height - 1),
+        max(int(left / scale), 0)
+    ) for top, right, bottom, left in locations]
+
+
+def detect_faces(img, detect_max_side=None):
+    """
+    Face boxes of a decoded image, detected on a copy no larger than
+    detect_max_side and mapped back onto img.
+    Returns (locations, detection_scale).
+    """
+    height, width = img.shape[:2]
+    detection_scale = 1.0
+    small = img
+    if detect_max_side and max(height, width) > detect_max_side:
+        detection_scale = detect_max_side / max(height, width)
+        size = (max(int(width * detection_scale), 1), max(int(height * detection_scale), 1))
+        small = np.array(Image.fromarray(img).resize(size, Image.BILINEAR))
+
+    face_locations = face_recognition.face_locations(small)
+    if detection_scale != 1.0:
+        face_locations = scale_locations(face_locations, detection_scale, img.shape)
+    return face_locations, detection_scale
+
+
+def detect_and_encode(image_bytes, decode_max_side=None, detect_max_side=None, model='small'):
+    """
+    Decode an uploaded photo, detect faces and return their encodings.
+
+    Detection runs on a copy no larger than detect_max_side (detection cost
+    grows with pixel count); the boxes are mapped back to the decoded image
+    so encodings are computed on the sharper crops.
+    Returns (encodings, info) where info reports the scale factors used.
+    """
+    img, decode_scale = load_image_for_detection(image_bytes, decode_max_side)
+    height, width = img.shape[:2]
+    face_locations, detection_scale = detect_faces(img, detect_max_side)
+
+    encodings = face_recognition.face_encodings(img, face_locations, model=model)
+    return encodings, {
+        "decoded_size": [width, height],
+        "decode_scale": round(decode_scale, 4),
+        "detection_scale": round(decode_scale * detection_scale, 4)  # relative to the original photo
+    }
+
+
+# ==================== MATCHING ====================
+def face_distance_matrix(face_encodings, gallery):
+    """
+    Euclidean distances between every detected face and every gallery entry,
+    as a (faces, gallery) matrix computed in one shot:
+    ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b
+    """
+    faces = np.asarray(face_encodings, dtype=np.float64).reshape(-1, 128)
+    if len(faces) == 0 or len(gallery) == 0:
+        return np.empty((len(faces), len(gallery)), dtype=np.float64)
+
+    face_sq = np.einsum('ij,ij->i', faces, faces)
+    sq = face_sq[:, None] + gallery.sq_norms[None, :] - 2.0 * (faces @ gallery.encodings.T)
+    np.maximum(sq, 0, out=sq)
+    return np.sqrt(sq, out=sq)
+
+
+def assign_greedy(distances, tolerance=MATCH_TOLERANCE):
+    """
+    Each face takes its nearest gallery entry if within tolerance; a student
+    already claimed by an earlier face is not matched again.
+    Returns a list of (face_idx, gallery_idx) pairs in face order.
+    """
+    if distances.size == 0:
+        return []
+
+    best = distances.argmin(axis=1)
+    best_distances = distances[np.arange(len(best)), best]
+    face_idx = np.flatnonzero(best_distances < tolerance)
+
+    # First face (in detection order) wins each student
+    _, first = np.unique(best[face_idx], return_index=True)
+    face_idx = np.sort(face_idx[first])
+    return [(int(f), int(best[f])) for f in face_idx]
+
+
+def min_cost_assignment(cost):
+    """
+    Rectangular linear assignment (Hungarian, shortest augmenting paths):
+    pairs every row of the smaller side with a distinct column so the total
+    cost is minimal. Plain NumPy, O(n^2 m) for an n x m matrix with n <= m,
+    which is instant at classroom sizes. Returns (rows, cols) index arrays.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # 1-based potentials; column 0 is the virtual start of each augmenting path
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=np.int64)  # row assigned to each column, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        row_of[0] = i
+        j0 = 0
+        min_v = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of[j0]
+            free = np.flatnonzero(~used[1:]) + 1
+            reduced = cost[i0 - 1, free - 1] - u[i0] - v[free]
+            improved = reduced < min_v[free]
+            min_v[free[improved]] = reduced[improved]
+            way[free[improved]] = j0
+            j1 = free[np.argmin(min_v[free])]
+            delta = min_v[j1]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            min_v[~used] -= delta
+            j0 = j1
+            if row_of[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            row_of[j0] = row_of[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(row_of[1:])
+    rows = row_of[cols + 1] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign_optimal(distances, tolerance=MATCH_TOLERANCE):
+    """
+    Global one-to-one assignment (Hungarian) over the whole distance matrix.
+    Pairs at or beyond tolerance are gated with a prohibitive cost so the
+    solver first maximises the number of valid matches, then minimises the
+    total distance. Returns (face_idx, gallery_idx) pairs in face order.
+    """
+    if distances.size == 0:
+        return []
+
+    gated = distances >= tolerance
+    cost = np.where(gated, 1e6, distances)
+    rows, cols = min_cost_assignment(cost)
+    return [(int(f), int(g)) for f, g in zip(rows, cols) if not gated[f, g]]
+
+
+ASSIGNMENT_MODES = {
+    'greedy': assign_greedy,
+    'optimal': assign_optimal
+}
+
+
+def collect_matches(distances, assignments, **provenance):
+    """(face_idx, gallery_idx) pairs -> match dicts consumed by build_recognition_result"""
+    matches = []
+    for face_idx, gallery_idx in assignments:
+        match = {"gallery_idx": gallery_idx, "distance": float(distances[face_idx, gallery_idx])}
+        if provenance:
+            match.update(provenance, face_index=face_idx)
+        matches.append(match)
+    return matches
+
+
+def build_recognition_result(gallery, matches, total_detected):
+    """
+    Turn matches into the /api/recognize payload.
+    Extra keys on a match (e.g. source image provenance) are copied into match_details.
+    """
+    present = []
+    present_ids = []
+    match_details = []
+
+    for match in matches:
+        gallery_idx = match["gallery_idx"]
+        distance = match["distance"]
+        name = gallery.names[gallery_idx]
+        confidence = 1 - distance  # Convert to confidence score
+
+        present.append(name)
+        present_ids.append(int(gallery.ids[gallery_idx]))
+        detail = {
+            "name": name,
+            "confidence": round(confidence * 100, 2),
+            "distance": round(distance, 3)
+        }
+        detail.update({k: v for k, v in match.items() if k not in ("gallery_idx", "distance")})
+        match_details.append(detail)
+        print(f"[MATCH] {name} - Confidence: {confidence*100:.1f}%")
+    # Calculate absent students
+    matched = set(present_ids)
+    absent = [name for sid, name in gallery.roster if sid not in matched]
+    absent_ids = [sid for sid, _ in gallery.roster if sid not in matched]
+
+    # Calculate overall accuracy
+    avg_confidence = sum(m['confidence'] for m in match_details) / len(match_details) if match_details else 0
+
+    return {
+        "success": True,
+        "present": present,
+        "present_ids": present_ids,
+        "absent": absent,
+        "absent_ids": absent_ids,
+        "total_students": len(gallery.roster),
+        "total_detected": total_detected,
+        "students_without_photos": gallery.students_without_photos,
+        "match_details": match_details,  # ✅ Confidence scores
+        "average_confidence": round(avg_confidence, 2)  # ✅ Overall accuracy
+    }
+
+
+# ==================== CAMPUS-WIDE SEARCH ====================
+_campus_index = {"key": None, "index": None, "students": {}}
+_campus_lock = threading.Lock()
+
+
+def get_campus_index():
+    """
+    IVF index over every stored embedding on campus, plus a student_id ->
+    details map. Rebuilt lazily after any gallery invalidation or when the
+    embedding store changed (row count / latest update, one cheap query).
+    Only students whose photo has been embedded (at upload or during a
+    classroom recognize) are searchable.
+    """
+    with _campus_lock:
+        count, last_update = db.session.query(
+            db.func.count(FaceEmbedding.id), db.func.max(FaceEmbedding.updated_at)
+        ).one()
+        key = (gallery_cache.generation, count, last_update)
+        if _campus_index["key"] == key:
+            return _campus_index["index"], _campus_index["students"]
+
+        rows = db.session.query(
+            FaceEmbedding.student_id,
+            FaceEmbedding.encoding,
+            Student.name,
+            Student.roll_no,
+            Student.classroom_id,
+            Classroom.name.label('classroom')
+        ).join(Student, FaceEmbedding.student_id == Student.id
+        ).join(Classroom, Student.classroom_id == Classroom.id
+        ).filter(FaceEmbedding.encoding.isnot(None)).all()
+
+        vectors = np.empty((len(rows), 128), dtype=np.float32)
+        students = {}
+        for i, r in enumerate(rows):
+            vectors[i] = bytes_to_encoding(r.encoding)
+            students[r.student_id] = {
+                "student_id": r.student_id,
+                "name": r.name,
+                "roll_no": r.roll_no,
+                "classroom_id": r.classroom_id,
+                "classroom": r.classroom
+            }
+
+        index = IVFIndex(n_probe=current_app.config.get('ANN_N_PROBE', 8))
+        index.build(vectors, np.array([r.student_id for r in rows], dtype=np.int64))
+        print(f"[INFO] Built campus face index over {len(rows)} embeddings")
+
+        _campus_index.update(key=key, index=index, students=students)
+        return index, students
@@ -0,0 +1,104 @@
+# backend/utils/gallery_cache.py
+# In-process LRU cache of per-classroom recognition galleries
+import threading
+import time
+from collections import OrderedDict
+
+
+class GalleryCache:
+    """
+    Size-bounded LRU cache keyed by classroom_id.
+
+    Every classroom has a version counter that is bumped by invalidate().
+    A gallery built while an invalidation happened is returned to the caller
+    but not stored, so a stale build can never overwrite a newer state.
+
+    invalidate() only reaches the process that served the write, so entries
+    are also checked against a database fingerprint of the classroom (roster,
+    names, roll numbers, photo paths, embeddings; see get()) and expire after
+    ttl seconds; the rebuild re-stats the photo files, which picks up images
+    replaced on disk under an unchanged path.
+    """
+
+    def __init__(self, max_size=32, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # classroom_id -> (version, fingerprint, expires_at, gallery)
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0  # hits rejected by fingerprint or TTL
+        self.generation = 0  # bumped on any invalidation (campus-wide indexes key on it)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('GALLERY_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('GALLERY_CACHE_TTL', self.ttl)
+
+    def get(self, classroom_id, builder, fingerprint=None):
+        """
+        Return cached gallery or build it with builder(classroom_id).
+        fingerprint(classroom_id), if given, is evaluated on every lookup; a
+        cached gallery is only used while it still returns the same value.
+        """
+        current = fingerprint(classroom_id) if fingerprint else None
+        with self._lock:
+            version = self._versions.get(classroom_id, 0)
+            entry = self._entries.get(classroom_id)
+            if entry and entry[0] == version:
+                if entry[1] == current and (not self.ttl or entry[2] > time.monotonic()):
+                    self._entries.move_to_end(classroom_id)
+                    self.hits += 1
+                    return entry[3]
+                self.stale += 1
+            self.misses += 1
+
+        gallery = builder(classroom_id)
+        # Re-read after the build: building stores embeddings it computed,
+        # which is part of the fingerprint
+        if fingerprint and gallery is not None:
+            current = fingerprint(classroom_id)
+
+        with self._lock:
+            if gallery is not None and self._versions.get(classroom_id, 0) == version:
+                self._entries[classroom_id] = (version, current, time.monotonic() + self.ttl, gallery)
+                self._entries.move_to_end(classroom_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return gallery
+
+    def invalidate(self, classroom_id):
+        """Drop a classroom's gallery after its students or photos change"""
+        if classroom_id is None:
+            return
+        classroom_id = int(classroom_id)
+        with self._lock:
+            self._versions[classroom_id] = self._versions.get(classroom_id, 0) + 1
+            self._entries.pop(classroom_id, None)
+            self.invalidations += 1
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            for classroom_id in list(self._entries):
+                self._versions[classroom_id] = self._versions.get(classroom_id, 0) + 1
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+                "ttl": self.ttl,
+                "hit_rate": round((self.hits / lookups * 100) if lookups > 0 else 0, 2)
+            }
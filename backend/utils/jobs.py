@@ -0,0 +1,100 @@
+# backend/utils/jobs.py
+# In-process background job queue (no external broker) for slow recognition calls
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class JobQueue:
+    """
+    Runs submitted callables on background threads inside an app context.
+
+    fn(*args, **kwargs) must return (payload, status_code). Job state lives in memory
+    of the web process, so a client must poll the same process (single
+    process deployment or sticky sessions). Finished jobs are kept for
+    result_ttl seconds.
+    """
+
+    def __init__(self, workers=2, max_pending=100, result_ttl=600):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.app = None
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.max_pending = app.config.get('JOB_MAX_PENDING', self.max_pending)
+        self.result_ttl = app.config.get('JOB_RESULT_TTL', self.result_ttl)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        return self._executor
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["finished_at"] and job["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, owner_id, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); returns the new job id"""
+        with self._lock:
+            self._purge()
+            pending = sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise JobQueueFull("Too many recognition jobs queued, please retry")
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "owner_id": str(owner_id),
+                "status": "queued",
+                "status_code": None,
+                "result": None,
+                "created_at": time.time(),
+                "finished_at": None
+            }
+            self._get_executor().submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        with self._lock:
+            self._jobs[job_id]["status"] = "running"
+        try:
+            with self.app.app_context():
+                payload, status_code = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"[ERROR] Job {job_id} failed: {e}")
+            payload, status_code = {"error": str(e)}, 500
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(
+                    status="done" if status_code < 400 else "failed",
+                    status_code=status_code,
+                    result=payload,
+                    finished_at=time.time()
+                )
+
+    def get(self, job_id):
+        """Copy of a job's state, or None if unknown / expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"workers": self.workers, "max_pending": self.max_pending, "by_status": counts}
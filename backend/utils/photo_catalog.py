@@ -0,0 +1,144 @@
+# backend/utils/photo_catalog.py
+# In-memory index of the images directory used to resolve student photos
+import os
+import threading
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class PhotoCatalog:
+    """
+    Maps students to their photo without probing the filesystem per student.
+
+    The images directory is listed once into lookup tables (filename, stem)
+    and re-listed only when its mtime changes (checked at most every
+    check_interval seconds) or when an upload route registers a photo.
+    Resolutions are memoized per student until the next rebuild.
+    """
+
+    def __init__(self, images_dir='images', check_interval=1.0):
+        self.images_dir = images_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._dir_mtime = None
+        self._checked_at = 0
+        self._filenames = []
+        self._by_filename = {}
+        self._by_stem = {}
+        self._resolved = {}  # (student_id, photo_path, name, roll_no) -> path or None
+        self.rebuilds = 0
+
+    def init_app(self, app):
+        self.images_dir = app.config.get('IMAGES_DIR', self.images_dir)
+
+    def _rebuild(self):
+        filenames = []
+        try:
+            with os.scandir(self.images_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        filenames.append(entry.name)
+            dir_mtime = os.stat(self.images_dir).st_mtime
+        except FileNotFoundError:
+            dir_mtime = None
+
+        filenames.sort()
+        by_stem = {}
+        for filename in filenames:
+            by_stem.setdefault(os.path.splitext(filename)[0].lower(), filename)
+
+        self._filenames = filenames
+        self._by_filename = {f: f for f in filenames}
+        self._by_stem = by_stem
+        self._resolved = {}
+        self._dir_mtime = dir_mtime
+        self.rebuilds += 1
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if self._dir_mtime is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            dir_mtime = os.stat(self.images_dir).st_mtime
+        except FileNotFoundError:
+            dir_mtime = None
+        if dir_mtime != self._dir_mtime or dir_mtime is None:
+            self._rebuild()
+
+    def invalidate(self):
+        """Force a re-list on next lookup (call after writing into images_dir)"""
+        with self._lock:
+            self._dir_mtime = None
+
+    def register(self, student, path):
+        """Record the photo an upload route just saved for a student"""
+        with self._lock:
+            self._refresh_if_changed()
+            filename = os.path.basename(path)
+            if os.path.dirname(path) == self.images_dir and filename not in self._by_filename:
+                self._filenames.append(filename)
+                self._by_filename[filename] = filename
+                self._by_stem.setdefault(os.path.splitext(filename)[0].lower(), filename)
+            self._resolved[self._key(student)] = path
+
+    @staticmethod
+    def _key(student):
+        return (student.id, student.photo_path, student.name, student.roll_no)
+
+    def resolve(self, student):
+        """
+        Same precedence as the old filesystem probing:
+        1. Exact path from photo_path column
+        2. Name-based matching (john_doe.jpg)
+        3. Roll number-based matching (101.jpg)
+        4. Partial name / roll number matching
+        """
+        with self._lock:
+            self._refresh_if_changed()
+            key = self._key(student)
+            if key in self._resolved:
+                return self._resolved[key]
+            path = self._lookup(student)
+            self._resolved[key] = path
+            return path
+
+    def _lookup(self, student):
+        join = lambda filename: os.path.join(self.images_dir, filename)
+
+        # Method 1: Exact path (may point into a sub-folder from a ZIP)
+        if student.photo_path:
+            if student.photo_path in self._by_filename:
+                return join(student.photo_path)
+            exact_path = join(student.photo_path)
+            if os.path.exists(exact_path):
+                return exact_path
+
+        # Method 2: Name-based (spaces replaced by underscores)
+        match = self._by_stem.get(student.name.replace(" ", "_").lower())
+        if match:
+            return join(match)
+
+        # Method 3: Roll number-based
+        match = self._by_stem.get(str(student.roll_no).lower())
+        if match:
+            return join(match)
+
+        # Method 4: Case-insensitive partial matching (only on a catalog miss)
+        name = student.name.lower()
+        roll_no = str(student.roll_no).lower()
+        for filename in self._filenames:
+            lowered = filename.lower()
+            if name in lowered or roll_no in lowered:
+                return join(filename)
+
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._filenames),
+                "resolved": len(self._resolved),
+                "rebuilds": self.rebuilds
+            }